@@ -12,7 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import re
 from commons import *
+from emitters import PythonExpression, PythonTask, PythonWriter, to_python
+from pipeline_ir import build_pipeline, optimize_pipeline
+from right_sizing import read_resource_recommendations
+
+BANNER = "# " + "-" * 80
+DATAFORM_BATCH_SENSOR_MODULE = "dataform_batch_sensor"
+DATAFORM_POLL_INTERVAL_SECONDS = 60
+# longest dependency chain emitted on one line, longer chains nest too deep for the Python parser
+MAX_CHAIN_LENGTH = 50
 
 
 class ComposerDagGenerator:
@@ -23,123 +33,344 @@ class ComposerDagGenerator:
         self.config_file = config_file
         self.json_file_name = json_file_name
         self.workflow_template = ''
-        self.level_template = ''
-        self.thread_template = ''
-        self.dataform_tag_executor_template = ''
-        self.dataflow_flextemplate_job_executor_template = ''
-        self.dataproc_serverless_job_executor_template = ''
+        self.timing_telemetry_template = ''
+        self.spark_right_sizing_template = ''
+        # modules the generated DAG imports, written next to it: file name -> content
+        self.support_files = {}
+        # level id -> poll interval of its Dataform jobs
+        self.level_poll_intervals = {}
+        self.timing_telemetry = timing_telemetry_enabled(exec_config)
+        self.duration_hints = read_duration_hints(exec_config)
+        self.resource_recommendations = read_resource_recommendations(exec_config)
 
     def load_templates(self):
-        """method for loading templates"""
+        """method for loading templates, only the static module prelude and callbacks, the DAG is emitted from the IR"""
         self.workflow_template = read_template("workflow", self.generate_for_pipeline, "composer-templates", "py")
-        self.level_template = read_template("level", self.generate_for_pipeline, "composer-templates", "py")
-        self.thread_template = read_template("thread", self.generate_for_pipeline, "composer-templates", "py")
-        # add new templates for other executors here
-        self.dataform_tag_executor_template = read_template("dataform_tag_executor", self.generate_for_pipeline,
-                                                            "composer-templates", "py")
-        self.dataflow_flextemplate_job_executor_template = read_template("dataflow_flextemplate_job_executor",
-                                                                         self.generate_for_pipeline,
-                                                                         "composer-templates", "py")
-        self.dataproc_serverless_job_executor_template = read_template("dataproc_serverless_job_executor",
-                                                                       self.generate_for_pipeline, "composer-templates",
-                                                                       "py")
+        if self.timing_telemetry:
+            self.timing_telemetry_template = read_template("timing_telemetry", self.generate_for_pipeline,
+                                                           "composer-templates", "py")
+        if any("spark_executor_instances" in recommendation
+               for recommendation in self.resource_recommendations.values()):
+            self.spark_right_sizing_template = read_template("spark_right_sizing", self.generate_for_pipeline,
+                                                             "composer-templates", "py")
+
+    def build_pipeline(self, config):
+        """method to build and optimise the pipeline IR"""
+        return optimize_pipeline(build_pipeline(config))
 
     def generate_workflows_body(self):
         """method to generate Airflow body"""
-        levels = self.process_levels(self.workflow_config)
-        workflow_body = self.workflow_template.replace("<<LEVELS>>", "".join(levels))
-        workflow_body = workflow_body.replace("<<LEVEL_DEPENDENCIES>>",
-                                              self.get_level_dependency_string(self.workflow_config))
-        workflow_body = workflow_body.replace("<<DAG_NAME>>", self.json_file_name)
-        workflow_body = workflow_body.replace("<<STEPS_ARGS>>", self.process_steps_vars(self.workflow_config))
-        return workflow_body
-
-    def process_steps_vars(self, config):
-        """Method to process steps vars"""
-        string_code = "{JOB_ID} = extract_job_params('{JOB_ID}','{FUNCTION_NAME}')\nfor key, value in {JOB_ID}.items():\n\tdefault_args['{JOB_ID}'+key] = value\n"
-        vars = [
-            string_code.format(
-                JOB_ID=step.get("JOB_NAME"), FUNCTION_NAME=step.get("COMPOSER_STEP")
-            )
-            for level in config
-            for thread in level.get("THREADS", [])
-            for step in thread.get("STEPS", [])
-        ]
-        return '\n'.join(vars)
+        pipeline = self.build_pipeline(self.workflow_config)
+        self.level_poll_intervals = {}
+        writer = PythonWriter()
+        self.process_support_modules(pipeline, writer)
+        self.process_steps_vars(pipeline, writer)
+        self.process_timing_telemetry(pipeline, writer)
+        self.process_spark_right_sizing(pipeline, writer)
+        writer.line(BANNER)
+        writer.line("# Main DAG")
+        writer.line(BANNER)
+        writer.line()
+        writer.call("with models.DAG", {
+            None: self.json_file_name,
+            "default_args": PythonExpression("default_args"),
+            "params": {
+                "start_date_str": PythonExpression("start_date_str"),
+                "end_date_str": PythonExpression("end_date_str")
+            },
+            "catchup": False,
+            "schedule_interval": None
+        }, " as dag:")
+        writer.indent += 4
+        writer.call("start = empty.EmptyOperator", {"task_id": "start", "trigger_rule": "all_success"})
+        writer.line()
+        self.process_levels(pipeline, writer)
+        writer.call("end = empty.EmptyOperator", {"task_id": "end", "trigger_rule": "all_success"})
+        writer.line()
+        writer.line(" >> ".join(["start"] + ["tg_Level_" + level.level_id for level in pipeline.levels] + ["end"]))
+        writer.indent -= 4
+        return self.workflow_template + "\n" + writer.text()
+
+    def process_support_modules(self, pipeline, writer):
+        """Method to import the support modules used by the pipeline jobs and queue them to be written with the DAG"""
+        self.support_files = {}
+        if any("dataform-tag-executor" in node.executor for node in pipeline.nodes()):
+            self.support_files[DATAFORM_BATCH_SENSOR_MODULE + ".py"] = read_template(
+                DATAFORM_BATCH_SENSOR_MODULE, self.generate_for_pipeline, "composer-templates", "py")
+            writer.line(f"from {DATAFORM_BATCH_SENSOR_MODULE} import DataformBatchInvocationSensor")
+            writer.line()
 
-    def get_level_dependency_string(self, config):
-        level_names = []
-        for level in config:
-            level_name = "tg_Level_" + level.get("LEVEL_ID")
-            level_names.append(level_name)
-        return " >> ".join(level_names)
+    def process_steps_vars(self, pipeline, writer):
+        """Method to process steps vars, loading the parameters file of every job into default_args"""
+        writer.line(BANNER)
+        writer.line("# Read the parameters file of every job")
+        writer.line(BANNER)
+        job_functions = {node.job_name: node.executor for node in pipeline.nodes()}
+        with writer.block("for job_name, function_name in " + to_python(job_functions) + ".items():"):
+            with writer.block("for key, value in extract_job_params(job_name, function_name).items():"):
+                writer.line("default_args[job_name + key] = value")
+        writer.line()
 
-    def process_levels(self, config):
+    def process_timing_telemetry(self, pipeline, writer):
+        """Method to process the timing telemetry callbacks block, nothing is emitted when telemetry is disabled"""
+        if not self.timing_telemetry:
+            return
+        writer.line("timing_job_ids = " + to_python({node.job_name: node.job_id for node in pipeline.nodes()}))
+        launch_task_ids = [self.get_launch_task_id(node) for node in pipeline.nodes()]
+        writer.line("timing_launch_task_ids = " + to_python(sorted(task_id for task_id in launch_task_ids if task_id)))
+        writer.lines.extend(self.timing_telemetry_template.splitlines())
+        writer.line()
+
+    def process_spark_right_sizing(self, pipeline, writer):
+        """Method to process the spark right-sizing helpers, only emitted when a Spark job of the DAG is right-sized"""
+        if any(self.get_spark_recommendation(node) for node in pipeline.nodes()
+               if "dataproc-serverless-job-executor" in node.executor):
+            writer.lines.extend(self.spark_right_sizing_template.splitlines())
+            writer.line()
+
+    def process_levels(self, pipeline, writer):
         """method to process levels"""
-        levels = []
-        for index, level in enumerate(config):
-            threads = self.process_threads(level.get("THREADS"), level.get("LEVEL_ID"))
-            level_body = self.level_template.replace("{LEVEL_ID}", level.get("LEVEL_ID"))
-            level_body = level_body.replace("<<THREADS>>", "".join(threads))
-            level_body = level_body.replace("<<THREAD_DEPENDENCIES>>",
-                                            self.get_thread_dependency_string(level.get("THREADS"),
-                                                                              level.get("LEVEL_ID")))
-            levels.append(level_body)
-
-        return levels
-
-    def get_thread_dependency_string(self, threads, level_id):
-        thread_names = []
-        for thread in threads:
-            thread_name = "tg_level_" + level_id + "_Thread_" + thread.get("THREAD_ID")
-            thread_names.append(thread_name)
-        return "\n           ".join(thread_names)
-
-    def process_threads(self, threads, level_id):
+        for level in pipeline.levels:
+            with writer.block(f'with TaskGroup(group_id="Level_{level.level_id}") as tg_Level_{level.level_id}:'):
+                self.process_threads(level, writer)
+            writer.line()
+
+    def process_threads(self, level, writer):
         """method to process threads"""
-        thread_bodies = []
-        for index, thread in enumerate(threads):
-            thread_body = self.thread_template.replace("{LEVEL_ID}", level_id)
-            thread_body = thread_body.replace("{THREAD_ID}", thread.get("THREAD_ID"))
-            steps = self.process_steps(thread.get("STEPS"), level_id, thread.get("THREAD_ID"))
-            thread_body = thread_body.replace("<<THREAD_STEPS>>", "".join(steps))
-            thread_body = thread_body.replace("<<THREAD_STEPS_DEPENDENCIES>>",
-                                              self.get_steps_dependency_string(thread.get("STEPS")))
-            thread_bodies.append(thread_body)
-        return thread_bodies
-
-    def get_steps_dependency_string(self, steps):
-        step_names = []
-        for step in steps:
-            step_name = step.get("JOB_NAME")
-            step_names.append(step_name)
-        return " >> ".join(step_names)
-
-    def process_steps(self, steps, level_id, thread_id):
-        """method to process steps"""
-        step_bodies = []
+        for thread in level.threads:
+            with writer.block(f'with TaskGroup(group_id="Level_{level.level_id}_Thread_{thread.thread_id}") '
+                              f'as tg_level_{level.level_id}_Thread_{thread.thread_id}:'):
+                self.process_steps(thread, writer)
+                for dependency in self.get_steps_dependency_strings(thread):
+                    writer.line(dependency)
+
+    def get_steps_dependency_strings(self, thread):
+        """method to get the dependency chains of a thread, following the IR edges that stay in the thread"""
+        positions = {node: index for index, node in enumerate(thread.nodes)}
+        chains = []
+        for index, node in enumerate(thread.nodes):
+            if node.next not in positions or positions[node.next] <= index:
+                continue
+            if chains and chains[-1][-1] is node and len(chains[-1]) < MAX_CHAIN_LENGTH:
+                chains[-1].append(node.next)
+            else:
+                chains.append([node, node.next])
+        return [" >> ".join(node.job_name for node in chain) for chain in chains]
 
-        for index, step in enumerate(steps):
-            step_body = self.process_step_async(level_id, thread_id, step)
-            step_body = step_body.replace("{LEVEL_ID}", level_id)
-            step_body = step_body.replace("{THREAD_ID}", thread_id)
-            step_bodies.append(step_body)
-        return step_bodies
+    def process_steps(self, thread, writer):
+        """method to process steps"""
+        for node in thread.nodes:
+            with writer.block(f'with TaskGroup(group_id="{node.job_name}") as {node.job_name}:'):
+                tasks = self.process_step_async(node)
+                for task in tasks:
+                    writer.statement(task)
+                if len(tasks) > 1:
+                    writer.line(" >> ".join(task.variable for task in tasks))
 
-    def process_step_async(self, level_id, thread_id, step):
+    def process_step_async(self, node):
         """method to process async step"""
-        step_name = step.get("JOB_NAME")
-        step_body = ''
-        ##Add new templates here
-        if "dataform-tag-executor" in step.get("COMPOSER_STEP"):
-            step_body = self.dataform_tag_executor_template.replace("{JOB_ID}", step_name)
-        if "dataflow-flextemplate-job-executor" in step.get("COMPOSER_STEP"):
-            step_body = self.dataflow_flextemplate_job_executor_template.replace("{JOB_ID}", step_name)
-        if "dataproc-serverless-job-executor" in step.get("COMPOSER_STEP"):
-            step_body = self.dataproc_serverless_job_executor_template.replace("{JOB_ID}", step_name)
-        step_body = step_body.replace("{LEVEL_ID}", level_id)
-        step_body = step_body.replace("{THREAD_ID}", thread_id)
-        step_body = step_body.replace("{JOB_IDENTIFIER}", step.get("JOB_ID"))
-        step_body = step_body.replace("{JOB_NAME}", step.get("JOB_NAME"))
-
-        return step_body
+        ##Add new executors here
+        if "dataform-tag-executor" in node.executor:
+            return self.process_dataform_tag_executor(node)
+        if "dataflow-flextemplate-job-executor" in node.executor:
+            return self.process_dataflow_flextemplate_job_executor(node)
+        if "dataproc-serverless-job-executor" in node.executor:
+            return self.process_dataproc_serverless_job_executor(node)
+        raise ValueError("Unsupported COMPOSER_STEP " + str(node.executor) + " for job " + node.job_name)
+
+    def get_job_param(self, node, key):
+        """method to get the expression reading a parameter of the job parameters file"""
+        return PythonExpression(f"default_args['{node.job_name}' + '{key}']")
+
+    def get_task_group_path(self, node):
+        """method to get the task id prefix of the tasks of a job"""
+        return f"Level_{node.level.level_id}.Level_{node.level.level_id}_Thread_{node.thread.thread_id}.{node.job_name}"
+
+    def get_launch_task_id(self, node):
+        """
+        method to get the task id of the task launching the job, whose end is logged as the launch by the timing
+        telemetry. Only the asynchronous Dataform invocation ends once the job is launched: the deferrable
+        Dataproc batch creation and the dataflow flex template task wait for the job to finish, so they have None
+        """
+        if "dataform-tag-executor" in node.executor:
+            return f"workflow_inv_{node.job_name}"
+        return None
+
+    def process_dataform_tag_executor(self, node):
+        """method to process a dataform tag executor step: compilation, invocation and level batched deferrable sensor"""
+        name = node.job_name
+        repository = {
+            "project_id": self.get_job_param(node, "dataform_project_id"),
+            "region": self.get_job_param(node, "dataform_location"),
+            "repository_id": self.get_job_param(node, "repository_name")
+        }
+        return [
+            PythonTask(f"create_compilation_result_for_{name}", "DataformCreateCompilationResultOperator", dict(
+                repository,
+                task_id=f"compilation_task_{name}",
+                compilation_result={
+                    "git_commitish": self.get_job_param(node, "branch"),
+                    "code_compilation_config": {
+                        "vars": {
+                            "start_date": "{{ params.start_date_str }}",
+                            "end_date": "{{ params.end_date_str }}"
+                        }
+                    }
+                })),
+            PythonTask(f"create_workflow_{name}_invocation", "DataformCreateWorkflowInvocationOperator", dict(
+                repository,
+                task_id=self.get_launch_task_id(node),
+                asynchronous=True,
+                workflow_invocation={
+                    "compilation_result": "{{ task_instance.xcom_pull('" + self.get_task_group_path(node) +
+                                          f".compilation_task_{name}')['name'] }}}}",
+                    "invocation_config": {
+                        "included_tags": self.get_job_param(node, "tags"),
+                        "transitive_dependencies_included": True
+                    }
+                },
+                trigger_rule="all_success")),
+            PythonTask(f"is_workflow_{name}_invocation_done", "DataformBatchInvocationSensor", dict(
+                repository,
+                task_id=f"is_workflow_{name}_invocation_done",
+                batch_key=f"Level_{node.level.level_id}",
+                workflow_invocation_id="{{ task_instance.xcom_pull('" + self.get_task_group_path(node) +
+                                       f".{self.get_launch_task_id(node)}')['name'].split('/')[-1] }}}}",
+                poll_interval=self.get_level_poll_interval_seconds(node.level),
+                **self.get_timing_arguments()))
+        ]
+
+    def get_timing_arguments(self):
+        """method to get the arguments making the dataform sensor log its polls when timing telemetry is enabled"""
+        if not self.timing_telemetry:
+            return {}
+        return {"timing_fields": PythonExpression("timing_event_fields")}
+
+    def get_level_poll_interval_seconds(self, level):
+        """method to get the poll interval shared by the Dataform jobs of a level, the shortest duration hint wins"""
+        if level.level_id in self.level_poll_intervals:
+            return self.level_poll_intervals[level.level_id]
+        intervals = [self.duration_hints.get(node.job_id, {}).get("recommended_wait_seconds",
+                                                                 DATAFORM_POLL_INTERVAL_SECONDS)
+                     for thread in level.threads for node in thread.nodes
+                     if "dataform-tag-executor" in node.executor]
+        self.level_poll_intervals[level.level_id] = int(min(intervals, default=DATAFORM_POLL_INTERVAL_SECONDS))
+        return self.level_poll_intervals[level.level_id]
+
+    def process_dataflow_flextemplate_job_executor(self, node):
+        """method to process a dataflow flex template job executor step"""
+        name = node.job_name
+        location = self.get_job_param(node, "dataflow_location")
+        gcs_path = ('"gs://dataflow-templates-{region}/{version}/flex/{template}".format(' +
+                    f"region={location.code}, "
+                    f"version={self.get_job_param(node, 'dataflow_template_version').code}, "
+                    f"template={self.get_job_param(node, 'dataflow_template_name').code})")
+        return [
+            PythonTask(f"dataflow_job_{name}", "DataflowStartFlexTemplateOperator", {
+                "task_id": f"dataflow_flex_template_{name}",
+                "location": location,
+                "body": {
+                    "launchParameter": {
+                        "jobName": re.sub(r"^\d+", "", re.sub(r"[^a-z0-9+]", "", name)),
+                        "parameters": self.get_job_param(node, "dataflow_job_params"),
+                        "containerSpecGcsPath": PythonExpression(gcs_path),
+                        "environment": {
+                            "tempLocation": PythonExpression('"gs://{bucket}/dataflow/temp".format(bucket=' +
+                                                             self.get_job_param(node, "dataflow_temp_bucket").code +
+                                                             ")"),
+                            "maxWorkers": self.get_max_workers(node),
+                            "network": self.get_str_job_param(node, "network"),
+                            "subnetwork": self.get_str_job_param(node, "subnetwork")
+                        }
+                    }
+                }
+            })
+        ]
+
+    def get_max_workers(self, node):
+        """method to get the dataflow max workers of a job, a resource recommendation overrides the job parameters"""
+        recommendation = self.resource_recommendations.get(node.job_id, {})
+        if "dataflow_max_workers" in recommendation:
+            return str(recommendation.get("dataflow_max_workers"))
+        return self.get_str_job_param(node, "dataflow_max_workers")
+
+    def get_spark_recommendation(self, node):
+        """method to get the Spark resource recommendation of a job, None if it has none"""
+        recommendation = self.resource_recommendations.get(node.job_id, {})
+        return recommendation if "spark_executor_instances" in recommendation else None
+
+    def get_spark_app_properties(self, node):
+        """
+        method to get the spark properties of a job, the resource recommendation is applied over the job parameters
+        when the DAG is parsed, as the executor cores and memory overhead bounding it are only known then
+        """
+        properties = self.get_job_param(node, "spark_app_properties")
+        recommendation = self.get_spark_recommendation(node)
+        if recommendation is None:
+            return properties
+        return PythonExpression(f"right_size_spark_properties({properties.code}, "
+                                f"{recommendation.get('spark_executor_instances')}, "
+                                f"{recommendation.get('spark_executor_memory_gb')})")
+
+    def get_str_job_param(self, node, key):
+        """method to get the expression reading a job parameter as a string"""
+        return PythonExpression("str(" + self.get_job_param(node, key).code + ")")
+
+    def process_dataproc_serverless_job_executor(self, node):
+        """method to process a dataproc serverless job executor step: batch creation, completion sensor and result"""
+        name = node.job_name
+        batch_id = ("{{ task_instance.xcom_pull(task_ids='" + self.get_task_group_path(node) +
+                    ".batch_id', key='batch-id') }}")
+        region = self.get_job_param(node, "dataproc_serverless_region")
+        return [
+            PythonTask(f"push_batch_id_to_xcom_{name}", "PythonOperator", {
+                "task_id": "batch_id",
+                "python_callable": PythonExpression("push_batch_id_to_xcom"),
+                "provide_context": True
+            }),
+            PythonTask(f"create_batch_for_{name}", "DataprocCreateBatchOperator", {
+                "task_id": f"create_batch_for_{name}",
+                "batch": {
+                    "spark_batch": {
+                        "jar_file_uris": [self.get_job_param(node, "jar_file_location")],
+                        "main_class": self.get_job_param(node, "spark_app_main_class"),
+                        "args": self.get_job_param(node, "spark_args")
+                    },
+                    "runtime_config": {
+                        "version": self.get_job_param(node, "dataproc_serverless_runtime_version"),
+                        "properties": self.get_spark_app_properties(node)
+                    },
+                    "environment_config": {
+                        "execution_config": {
+                            "service_account": self.get_job_param(node, "dataproc_service_account"),
+                            "subnetwork_uri": PythonExpression(
+                                '"projects/" + ' +
+                                self.get_str_job_param(node, "dataproc_serverless_project_id").code +
+                                ' + "/" + ' + self.get_str_job_param(node, "subnetwork").code)
+                        }
+                    }
+                },
+                "batch_id": batch_id,
+                "project_id": self.get_job_param(node, "dataproc_serverless_project_id"),
+                "region": region,
+                "deferrable": True
+            }),
+            PythonTask(f"wait_for_batch_completion_for_{name}", "DataprocBatchSensor", {
+                "task_id": f"wait_for_batch_completion_for_{name}",
+                "batch_id": batch_id,
+                "region": region,
+                "poke_interval": self.get_poke_interval_seconds(node.step),
+                "timeout": 3600,
+                "soft_fail": True
+            }),
+            PythonTask(f"get_batch_for_{name}", "DataprocGetBatchOperator", {
+                "task_id": f"get_batch_for_{name}",
+                "batch_id": batch_id,
+                "region": region
+            })
+        ]
+
+    def get_poke_interval_seconds(self, step):
+        """method to get the sensor poke interval of a step, a duration hint overrides the default"""
+        hint = self.duration_hints.get(step.get("JOB_ID"), {})
+        return parse_seconds(hint.get("recommended_wait_seconds", 400))
@@ -13,6 +13,8 @@
 # limitations under the License.
 
 from commons import *
+from emitters import to_yaml
+from pipeline_ir import build_pipeline, optimize_pipeline
 
 class WorkflowsGenerator:
     def __init__(self, workflow_config, exec_config, generate_for_pipeline, config_file ):
@@ -20,212 +22,190 @@ class WorkflowsGenerator:
         self.exec_config = exec_config
         self.generate_for_pipeline = generate_for_pipeline
         self.config_file = config_file
-        self.workflow_template = ''
-        self.level_template = ''
-        self.thread_template = ''
-        self.cloud_function_async_template = ''
-        self.workflows_sync_template = ''
-        self.cloud_function_sync_template = ''
-        self.workflows_folder = "workflows-templates"
+        self.timing_telemetry = timing_telemetry_enabled(exec_config)
+        self.duration_hints = read_duration_hints(exec_config)
+        self.support_files = {}
 
 
     def load_templates(self):
-        """method for loading templates"""
-        self.workflow_template = read_template("workflow",self.generate_for_pipeline, self.workflows_folder, "json")
-        self.level_template = read_template("level",self.generate_for_pipeline, self.workflows_folder, "json")
-        self.thread_template = read_template("thread",self.generate_for_pipeline, self.workflows_folder, "json")
-        self.cloud_function_async_template = read_template("async_call",self.generate_for_pipeline, self.workflows_folder, "json")
+        """method for loading templates, Cloud Workflows are fully emitted from the pipeline IR"""
 
 
-    def get_unidented_template(self,template):
-        new_template_lines = []
-        lines = template.splitlines()
-        for line in lines:
-            line = line[12:]
-            new_template_lines.append(line)
-        return '\n'.join(new_template_lines)
-
+    def build_pipeline(self, config):
+        """method to build and optimise the pipeline IR"""
+        return optimize_pipeline(build_pipeline(config))
 
 
     def generate_workflows_body(self):
         """method to generate cloud workflows body"""
-        levels = self.process_levels(self.workflow_config)
-        workflow_body = self.workflow_template.replace("<<LEVELS>>", "".join(levels))
-        return workflow_body
-
-
-
-    def process_levels(self,config):
+        pipeline = self.build_pipeline(self.workflow_config)
+        workflow = {
+            "main": {
+                "params": ["args"],
+                "steps": [{
+                    "workflow": {
+                        "try": {"steps": self.process_levels(pipeline)},
+                        "except": {
+                            "as": "e",
+                            "steps": [
+                                {"log": {"call": "sys.log", "args": {"data": "${e}"}}},
+                                {"unhandled_exception": {"raise": "${e}"}}
+                            ]
+                        }
+                    }
+                }]
+            }
+        }
+        return to_yaml(workflow)
+
+
+    def process_levels(self,pipeline):
         """method to process levels"""
         levels = []
-        for index, level in enumerate(config):
-            threads = self.process_threads(level.get("THREADS"), level.get("LEVEL_ID"))
-            if len(threads) == 1:
-                level_body = "               <<THREADS>>"
+        for level in pipeline.levels:
+            threads = self.process_threads(level)
+            if level.parallel:
+                levels.append({"Level_" + level.level_id: {"parallel": {"branches": threads}}})
             else:
-                level_body = self.level_template.replace("{LEVEL_ID}", level.get("LEVEL_ID"))
-            level_body = level_body.replace("<<THREADS>>", "".join(threads))
-            if len(level.get("THREADS")) == 1:
-                level_body = self.get_unidented_template(level_body)
-            levels.append(level_body)
+                levels.extend(threads)
         return levels
 
 
-    def process_threads(self,threads, level_id):
+    def process_threads(self,level):
         """method to process threads"""
-        thread_bodies = []
-        single_thread = len(threads) == 1
-        for index, thread in enumerate(threads):
-            thread_body = self.thread_template.replace("{LEVEL_ID}", level_id)
-            thread_body = thread_body.replace("{THREAD_ID}", thread.get("THREAD_ID"))
-            #first_step_in_thread = thread.get("STEPS")[0].get("JOB_ID") + "_" + thread.get("STEPS")[0].get("JOB_NAME")
-            first_step_in_thread = thread.get("STEPS")[0].get("JOB_NAME")
-            thread_body = thread_body.replace("{STARTING_JOB_ID}", first_step_in_thread)
-            steps = self.process_steps(thread.get("STEPS"), level_id, thread.get("THREAD_ID"), single_thread)
-            thread_body = thread_body.replace("<<THREAD_STEPS>>", "".join(steps))
-            thread_bodies.append(thread_body)
-        return thread_bodies
-
-
-    def process_steps(self,steps, level_id, thread_id, single_thread):
-        """method to process steps"""
-        step_bodies = []
-        cloud_function_intermediate_name = self.exec_config.get("pFunctionIntermediateName")
-        jobs_definitions_bucket = self.exec_config.get("pJobsDefinitionsBucket")
+        return [{self.get_thread_step_name(thread): {"steps": self.process_steps(thread)}}
+                for thread in level.threads]
 
-        for index, step in enumerate(steps):
-            step_body = ''
-            if step.get("TYPE") == 'sync':
-                step_body = self.process_step_sync(
-                    assemble_cloud_function_id(cloud_function_intermediate_name, self.exec_config), step,
-                    step.get("FUNCTION_NAME"))
-            elif step.get("TYPE") == 'async':
-                step_body = self.process_step_async(level_id,
-                    assemble_cloud_function_id(cloud_function_intermediate_name, self.exec_config), step,
-                    step.get("FUNCTION_ID_NAME"),
-                    step.get("FUNCTION_STATUS_NAME"),jobs_definitions_bucket)
-            #TODO workflows functionality
-            elif step.get("TYPE") == 'workflows':
-                workflows_name = step.get("workflows_name")
-                workflows_id = assemble_workflows_id(workflows_name)
-                step_body = self.process_step_workflows(workflows_id, step)
-
-            step_body = step_body.replace("{LEVEL_ID}", level_id)
-            step_body = step_body.replace("{THREAD_ID}", thread_id)
-            step_body = self.process_next_step(steps, step, index, level_id, thread_id, step_body,single_thread)
-            step_bodies.append(step_body)
-        return step_bodies
-
-
-    def process_step_sync(self,cloud_function_level_1_id, step, cloud_function_name):
-        """method to process sync step"""
-        #step_name = step.get("JOB_ID") + "_" + step.get("JOB_NAME")
-        step_name = step.get("JOB_NAME")
-        step_body = self.cloud_function_sync_template.replace("{JOB_ID}", step_name)
-        step_body = step_body.replace("{CLOUD_FUNCITON_ID}", cloud_function_level_1_id)
-        step_body = step_body.replace("{CLOUD_FUNCTION_TO_INVOKE}", cloud_function_name)
-        step_body = step_body.replace("{ENVIRONMENT}", self.environment)
-        step_body = step_body.replace("{JOB_IDENTIFIER}", step.get("JOB_ID"))
-        step_body = step_body.replace("{JOB_NAME}", step.get("JOB_NAME"))
-        if "TIMEOUT_SECONDS" in step.keys():
-            step_body = step_body.replace("{TIMEOUT_SECONDS_BLOCK}",
-                                          '"TimeoutSeconds": ' + step.get("TIMEOUT_SECONDS") + ',')
-        else:
-            step_body = step_body.replace("{TIMEOUT_SECONDS_BLOCK}", '')
 
-        #TODO continue if fail logic
-        if "CONTINUE_IF_FAIL" in step.keys():
-            step_body = step_body.replace("{CONTINUE_IF_FAIL_BLOCK}", ',"PcontinueIfFail": "True"')
-        else:
-            step_body = step_body.replace("{CONTINUE_IF_FAIL_BLOCK}", '')
+    def get_thread_step_name(self, thread):
+        """method to get the name of the step wrapping a thread"""
+        return "Level_" + thread.level.level_id + "_Thread_" + thread.thread_id
 
-        return step_body
 
+    def get_level_entry_step_name(self, level):
+        """method to get the name of the step a level starts with"""
+        if level.parallel:
+            return "Level_" + level.level_id
+        return self.get_thread_step_name(level.threads[0])
 
-    def process_step_async(self,level_id, cloud_funciton_level_1_id, step, FUNCTION_ID_NAME, FUNCTION_STATUS_NAME, jobs_definitions_bucket):
-        """method to process async step"""
-        #step_name = step.get("JOB_ID") + "_" + step.get("JOB_NAME")
-        step_name = step.get("JOB_NAME")
-        step_body = self.cloud_function_async_template.replace("{JOB_ID}", step_name)
-        step_body = step_body.replace("{LEVEL_ID}", level_id)
-        step_body = step_body.replace("{CLOUD_FUNCTION_ID}", cloud_funciton_level_1_id)
-        step_body = step_body.replace("{CLOUD_FUNCTION_ID_TO_INVOKE}", assemble_cloud_function_id(FUNCTION_ID_NAME,self.exec_config))
-        step_body = step_body.replace("{CLOUD_FUNCTION_STATUS_TO_INVOKE}",assemble_cloud_function_id(FUNCTION_STATUS_NAME,self.exec_config))
-        step_body = step_body.replace("{JOB_IDENTIFIER}", step.get("JOB_ID"))
-        step_body = step_body.replace("{JOB_NAME}", step.get("JOB_NAME"))
-        step_body = step_body.replace("{WAIT_TIME_SECONDS}", step.get("WAIT_TIME_SECONDS"))
-        step_body = step_body.replace("{WAIT_TIME_SECONDS}", step.get("WAIT_TIME_SECONDS"))
-        step_body = step_body.replace("{ASYNC_JOB_ID_VARIABLE_NAME}", step.get("JOB_ID") +
-                                      "_async_job_id")
-        step_body = step_body.replace("{ASYNC_JOB_STATUS_VARIABLE_NAME}", step.get("JOB_ID") +
-                                      "_async_job_status")
-        if "READ_INPUT_FROM" in step.keys():
-            step_body = step_body.replace("{READ_INPUT_FROM}", step.get("READ_INPUT_FROM"))
-        else:
-            step_body = step_body.replace("{READ_INPUT_FROM}", "ENV")
-        if "TIMEOUT_SECONDS" in step.keys():
-            step_body = step_body.replace("{TIMEOUT_SECONDS_BLOCK}",
-                                          '"TimeoutSeconds": ' + step.get("TIMEOUT_SECONDS") + ',')
-        else:
-            step_body = step_body.replace("{TIMEOUT_SECONDS_BLOCK}", '')
-        if "ASYNC_TIMEOUT_LOOP_IN_MINUTES" in step.keys():
-            step_body = step_body.replace("{ASYNC_TIMEOUT_LOOP_BLOCK}",
-                                          ',"PtimeoutMinutes": ' + step.get(
-                                              "ASYNC_TIMEOUT_LOOP_IN_MINUTES"))
-        else:
-            step_body = step_body.replace("{ASYNC_TIMEOUT_LOOP_BLOCK}", '')
-        if "CONTINUE_IF_FAIL" in step.keys():
-            step_body = step_body.replace("{CONTINUE_IF_FAIL_BLOCK}", ',"PcontinueIfFail": "True"')
-        else:
-            step_body = step_body.replace("{CONTINUE_IF_FAIL_BLOCK}", '')
-        if "STEP_PROPERTIES" in step.keys():
-            step_body = step_body.replace("{STEP_PROPERTIES_BLOCK}", "step_properties: > \n"
-                                          + "                                                                 "
-                                          + step.get("STEP_PROPERTIES"))
-        else:
-            step_body = step_body.replace("{STEP_PROPERTIES_BLOCK}", "step_properties: > \n"
-                                          + "                                                                 "
-                                          + str(f'{{"jobs_definitions_bucket":"{jobs_definitions_bucket}"}}'))
-        return step_body
-
-
-    def process_step_workflows(self,workflows_id, step):
-        """method to process step of workflows type"""
-        #step_name = step.get("JOB_ID") + "_" + step.get("JOB_NAME")
-        step_name = step.get("JOB_NAME")
-        step_body = self.workflows_sync_template.replace("{JOB_ID}", step_name)
-        step_body = step_body.replace("{workflows_id}", workflows_id)
-        return step_body
 
+    def process_steps(self,thread):
+        """method to process steps"""
+        steps = []
+        cloud_function_intermediate_name = self.exec_config.get("pFunctionIntermediateName")
+        jobs_definitions_bucket = self.exec_config.get("pJobsDefinitionsBucket")
+        for node in thread.nodes:
+            if node.type != 'async':
+                raise ValueError("Unsupported TYPE " + str(node.type) + " for job " + str(node.job_name))
+            steps.append(self.process_step_async(
+                node, assemble_cloud_function_id(cloud_function_intermediate_name, self.exec_config),
+                jobs_definitions_bucket))
+        return steps
 
 
-    def process_next_step(self,steps, step, index, level_id, thread_id, step_body, single_thread):
+    def process_step_async(self, node, cloud_function_level_1_id, jobs_definitions_bucket):
+        """method to process async step"""
+        step = node.step
+        step_name = node.job_name
+        level_id = node.level.level_id
+        if "STEP_PROPERTIES" in step.keys():
+            step_properties = step.get("STEP_PROPERTIES")
+        else:
+            step_properties = json.dumps({"jobs_definitions_bucket": jobs_definitions_bucket}, separators=(",", ":"))
+        launch_step = step_name + "_Launch" if self.timing_telemetry else step_name
+        end_step = step_name + "_End" if self.timing_telemetry else self.process_next_step(node)
+        group_steps = [
+            {launch_step: self.get_http_post_call(
+                cloud_function_level_1_id,
+                self.get_request_body(node, {"call_type": "get_id"}, step.get("FUNCTION_ID_NAME"), step_properties),
+                "async_job_id_" + level_id,
+                step_name + ("_Launched" if self.timing_telemetry else "_Wait"))},
+            {step_name + "_Wait": {
+                "call": "sys.sleep",
+                "args": {"seconds": self.get_wait_time_seconds(step)},
+                "next": step_name + "_Status"}},
+            {step_name + "_Status": self.get_http_post_call(
+                cloud_function_level_1_id,
+                self.get_request_body(node, {"call_type": "get_status",
+                                             "async_job_id": "${async_job_id_" + level_id + ".body}"},
+                                      step.get("FUNCTION_STATUS_NAME"), step_properties),
+                "job_status_" + level_id,
+                step_name + ("_Polled" if self.timing_telemetry else "_EvaluateStatus"))},
+            {step_name + "_EvaluateStatus": {
+                "switch": [{"condition": '${job_status_' + level_id + '.body == "success"}', "next": end_step}],
+                "next": step_name + "_Wait"}}
+        ]
+        if self.timing_telemetry:
+            group_steps.insert(0, self.get_timing_event_step(node, step_name, "job_start", launch_step))
+            group_steps.insert(2, self.get_timing_event_step(node, step_name + "_Launched", "job_launched",
+                                                             step_name + "_Wait"))
+            group_steps.insert(5, self.get_timing_event_step(node, step_name + "_Polled", "job_poll",
+                                                             step_name + "_EvaluateStatus",
+                                                             "${job_status_" + level_id + ".body}"))
+            group_steps.append(self.get_timing_event_step(node, end_step, "job_end", self.process_next_step(node),
+                                                          "success"))
+        return {step_name + "_Group": {"steps": group_steps}}
+
+
+    def get_request_body(self, node, call, function_name, step_properties):
+        """method to get the body sent to the intermediate cloud function"""
+        return dict(call, **{
+            "workflow_name": "${args.workflow_name}",
+            "execution_id": '${sys.get_env("GOOGLE_CLOUD_WORKFLOW_EXECUTION_ID")}',
+            "job_name": node.job_name,
+            "function_url_to_call": assemble_cloud_function_id(function_name, self.exec_config),
+            "query_variables": "${args.query_variables}",
+            "workflow_properties": "${args.workflow_properties}",
+            "step_properties": step_properties
+        })
+
+
+    def get_http_post_call(self, url, body, result, next_step):
+        """method to get an authenticated call to the intermediate cloud function"""
+        return {
+            "call": "http.post",
+            "args": {
+                "url": url,
+                "auth": {"type": "OIDC"},
+                "headers": {"Content-Type": "application/json"},
+                "body": body
+            },
+            "result": result,
+            "next": next_step
+        }
+
+
+    def get_timing_event_step(self, node, step_name, event, next_step, status=None):
+        """method to get a sys.log step emitting a structured timing event"""
+        timing_event = {
+            "telemetry": "aef_timing",
+            "event": event,
+            "workflow_name": '${sys.get_env("GOOGLE_CLOUD_WORKFLOW_ID")}',
+            "run_id": '${sys.get_env("GOOGLE_CLOUD_WORKFLOW_EXECUTION_ID")}',
+            "job_id": node.job_id,
+            "job_name": node.job_name,
+            "level_id": node.level.level_id,
+            "thread_id": node.thread.thread_id,
+            "wait_seconds": self.get_wait_time_seconds(node.step)
+        }
+        if status is not None:
+            timing_event["status"] = status
+        timing_event["timestamp"] = "${sys.now()}"
+        return {step_name: {"call": "sys.log", "args": {"severity": "INFO", "json": timing_event}, "next": next_step}}
+
+
+    def get_wait_time_seconds(self, step):
+        """method to get the polling wait of an async step, a duration hint overrides the definition"""
+        hint = self.duration_hints.get(step.get("JOB_ID"), {})
+        return parse_seconds(hint.get("recommended_wait_seconds", step.get("WAIT_TIME_SECONDS")))
+
+
+    def process_next_step(self,node):
         """method to process next step"""
-        if step.get("TYPE") in ('sync', 'async', 'workflows'):
-            if "NEXT" not in step.keys():
-                try:
-                    next_step = steps[index + 1]
-                    #next_step_name = next_step.get("JOB_ID") + "_" + next_step.get("JOB_NAME")
-                    next_step_name = next_step.get("JOB_NAME")
-                    step_body = step_body.replace("{NEXT_JOB_ID}", next_step_name)
-                except (KeyError, IndexError):
-                    if level_exists(int(level_id) + 1, self.workflow_config) and single_thread:
-                        if level_exists_and_is_parallel(int(level_id) + 1, self.workflow_config):
-                            step_body = step_body.replace("{NEXT_JOB_ID}",
-                                                     "Level_" + str(int(level_id) + 1))
-                        else:
-                            step_body = step_body.replace("{NEXT_JOB_ID}",
-                                                          "Level_" + str(int(level_id) + 1) + "_Thread_" + thread_id)
-                    else:
-                        if single_thread:
-                            step_body = step_body.replace("{NEXT_JOB_ID}","end")
-                        else:
-                            step_body = step_body.replace("{NEXT_JOB_ID}","continue")
-            else:
-                next_step = find_step_by_id(step.get("NEXT"))
-                #next_step_name = next_step.get("JOB_ID") + "_" + next_step.get("JOB_NAME")
-                next_step_name = next_step.get("JOB_NAME")
-                step_body = step_body.replace("{NEXT_JOB_ID}", next_step_name)
-
-        return step_body
-
+        if node.next is not None:
+            return node.next.job_name
+        if not node.level.parallel and node.level.next_level is not None:
+            return self.get_level_entry_step_name(node.level.next_level)
+        if not node.level.parallel:
+            return "end"
+        return "continue"
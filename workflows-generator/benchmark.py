@@ -0,0 +1,362 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ast
+import contextlib
+import gc
+import io
+import json
+import re
+import time
+import tracemalloc
+import types
+from commons import *
+from ComposerDagGenerator import ComposerDagGenerator, DATAFORM_BATCH_SENSOR_MODULE
+from WorkflowsGenerator import WorkflowsGenerator
+
+DEFAULT_SHAPES = ["2x2x2", "10x5x5", "25x10x8", "1x1x6000"]
+DEFAULT_THRESHOLD_PERCENT = 25
+# every timing is repeated at least MIN_REPEATS times and until MIN_MEASURE_SECONDS have been spent on it
+MIN_REPEATS = 7
+MAX_REPEATS = 200
+MIN_MEASURE_SECONDS = 0.5
+# a timing regresses only beyond this, or beyond IQR_TOLERANCE times the spread of the runs if larger
+NOISE_FLOOR_SECONDS = 0.005
+IQR_TOLERANCE = 1.5
+# timing regressions are measured again this many times and only reported if they persist
+CONFIRM_RUNS = 2
+# every NEXT_JUMP_EVERY job jumps over the following step, which becomes unreachable
+NEXT_JUMP_EVERY = 4
+# the last job of every CROSS_THREAD_JUMP_EVERY thread jumps into the next thread of its level
+CROSS_THREAD_JUMP_EVERY = 3
+EXECUTORS = ["dataproc-serverless-job-executor", "dataflow-flextemplate-job-executor", "dataform-tag-executor"]
+BENCHMARK_EXEC_CONFIG = {
+    "pRegion": "us-central1",
+    "pProjectID": "benchmark-project",
+    "pFunctionIntermediateName": "orch-framework-intermediate",
+    "pJobsDefinitionsBucket": "benchmark_aef_jobs_bucket"
+}
+# metrics where a higher value in the current run than in the baseline is a regression
+COMPARED_METRICS = ["wall_seconds", "peak_memory_bytes", "output_bytes", "dag_parse_seconds", "dag_import_seconds"]
+
+
+def synthesize_definition(levels, threads, steps, engine):
+    """
+    Function to synthesize a pipeline definition of a given shape
+    :param levels: number of levels
+    :param threads: number of threads per level
+    :param steps: number of steps per thread
+    :param engine: cloud_workflows or composer
+    :return: definition in the same form as the "definition" key of workflow-definitions files
+    """
+    definition = []
+    job_number = 0
+    for level_index in range(1, levels + 1):
+        level_threads = []
+        for thread_index in range(1, threads + 1):
+            thread_id = str((level_index - 1) * threads + thread_index)
+            thread_steps = []
+            for step_index in range(steps):
+                job_number += 1
+                executor = EXECUTORS[job_number % len(EXECUTORS)]
+                step = {
+                    "JOB_ID": f"J{job_number:05d}",
+                    "JOB_NAME": f"job_{level_index}_{thread_id}_{step_index}",
+                    "TYPE": "async"
+                }
+                if engine == "cloud_workflows":
+                    step["FUNCTION_ID_NAME"] = executor
+                    step["FUNCTION_STATUS_NAME"] = executor
+                    step["WAIT_TIME_SECONDS"] = "30"
+                    step["ASYNC_TIMEOUT_LOOP_IN_MINUTES"] = "12"
+                else:
+                    step["COMPOSER_STEP"] = executor
+                if job_number % NEXT_JUMP_EVERY == 0 and step_index < steps - 2:
+                    step["NEXT"] = f"J{job_number + 2:05d}"
+                elif (step_index == steps - 1 and thread_index < threads
+                      and thread_index % CROSS_THREAD_JUMP_EVERY == 0):
+                    step["NEXT"] = f"J{job_number + min(2, steps):05d}"
+                thread_steps.append(step)
+            level_threads.append({"THREAD_ID": thread_id, "STEPS": thread_steps})
+        definition.append({"LEVEL_ID": str(level_index), "THREADS": level_threads})
+    return definition
+
+
+def generate(engine, definition, dag_name):
+    """
+    method to run a generator in-process, the same way orchestration_generator.py does. Its output is discarded,
+    as the synthesized NEXT jumps make it warn about skipped jobs on every run
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        if engine == "cloud_workflows":
+            generator = WorkflowsGenerator(definition, BENCHMARK_EXEC_CONFIG, True, "")
+        else:
+            generator = ComposerDagGenerator(definition, BENCHMARK_EXEC_CONFIG, True, "", dag_name)
+        generator.load_templates()
+        return generator.generate_workflows_body()
+
+
+class StubMeta(type):
+    """Metaclass answering any class attribute with the stub class, e.g. WorkflowInvocation.State.SUCCEEDED"""
+
+    def __getattr__(cls, name):
+        return cls
+
+
+class StubObject(metaclass=StubMeta):
+    """Stand-in for Airflow and Google provider objects: accepts any arguments and supports >> and with"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return StubObject()
+
+    def __getattr__(self, name):
+        return StubObject()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def __rshift__(self, other):
+        return other
+
+    def __rrshift__(self, other):
+        return self
+
+
+class StubStorageClient:
+    """Stand-in for google.cloud.storage.Client serving job parameter files with every key the DAG reads"""
+
+    def __init__(self, job_params):
+        self.job_params = job_params
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def bucket(self, name):
+        return self
+
+    def blob(self, name):
+        return self
+
+    def download_as_bytes(self):
+        return self.job_params
+
+
+def stub_provider_modules(dag_code):
+    """
+    Function to build stub modules for every module imported by a generated DAG
+    :param dag_code: generated DAG source
+    :return: dictionary of module name to stub module
+    """
+    job_params = {key: "stub" for key in re.findall(r"default_args\['\w+'\s*\+\s*'(\w+)'\]", dag_code)}
+    modules = {}
+    for node in ast.walk(ast.parse(dag_code)):
+        names = []
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            names = [node.module]
+        for name in names:
+            parts = name.split(".")
+            if parts[0] not in ("airflow", "google", DATAFORM_BATCH_SENSOR_MODULE):
+                continue
+            for index in range(1, len(parts) + 1):
+                module_name = ".".join(parts[:index])
+                if module_name not in modules:
+                    module = types.ModuleType(module_name)
+                    module.__path__ = []
+                    module.__getattr__ = lambda attribute: StubObject
+                    modules[module_name] = module
+    storage = types.ModuleType("google.cloud.storage")
+    storage.Client = StubStorageClient(json.dumps(job_params).encode("utf-8"))
+    modules["google.cloud.storage"] = storage
+    for module_name, module in modules.items():
+        if "." in module_name:
+            parent, child = module_name.rsplit(".", 1)
+            setattr(modules[parent], child, module)
+    return modules
+
+
+def measure_dag_import(dag_code):
+    """
+    Function to measure the parse (compile) and import (execution) time of a generated DAG against stub providers
+    :param dag_code: generated DAG source
+    :return: tuple of parse seconds and import seconds
+    """
+    stubs = stub_provider_modules(dag_code)
+    saved_modules = {name: sys.modules[name] for name in stubs if name in sys.modules}
+    sys.modules.update(stubs)
+    try:
+        start = time.perf_counter()
+        code = compile(dag_code, "<generated_dag>", "exec")
+        parsed = time.perf_counter()
+        exec(code, {"__name__": "generated_dag"})
+        imported = time.perf_counter()
+    finally:
+        for name in stubs:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved_modules)
+    return parsed - start, imported - parsed
+
+
+def benchmark_case(engine, shape):
+    """
+    Function to benchmark one engine on one definition shape
+    :return: dictionary of metrics
+    """
+    levels, threads, steps = [int(value) for value in shape.split("x")]
+    definition = synthesize_definition(levels, threads, steps, engine)
+    dag_name = "benchmark_" + shape
+    body = generate(engine, definition, dag_name)
+    wall_seconds, wall_iqr = measure(lambda: generate(engine, definition, dag_name))
+    tracemalloc.start()
+    generate(engine, definition, dag_name)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    metrics = {
+        "steps": levels * threads * steps,
+        "wall_seconds": wall_seconds,
+        "wall_seconds_iqr": wall_iqr,
+        "peak_memory_bytes": peak_memory,
+        "output_bytes": len(body.encode("utf-8"))
+    }
+    if engine == "composer":
+        import_times = []
+        measure(lambda: import_times.append(measure_dag_import(body)))
+        for index, metric in enumerate(["dag_parse_seconds", "dag_import_seconds"]):
+            metrics[metric] = percentile([times[index] for times in import_times], 50)
+            metrics[metric + "_iqr"] = iqr([times[index] for times in import_times])
+    return metrics
+
+
+def measure(function):
+    """
+    Function to time a function, repeating it until enough samples and time are collected. As in timeit,
+    garbage collection is disabled while timing so collections do not land on random samples
+    :return: tuple of median seconds and interquartile range
+    """
+    times = []
+    started = time.perf_counter()
+    while len(times) < MAX_REPEATS and (len(times) < MIN_REPEATS
+                                        or time.perf_counter() - started < MIN_MEASURE_SECONDS):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return percentile(times, 50), iqr(times)
+
+
+def run_benchmarks(shapes):
+    """method to run every engine on every shape"""
+    results = {}
+    for shape in shapes:
+        for engine in ("cloud_workflows", "composer"):
+            metrics = benchmark_case(engine, shape)
+            results[engine + "/" + shape] = metrics
+            print(f'{engine + "/" + shape:<28}' + "  ".join(f'{name}={value:.6g}' for name, value in metrics.items()
+                                                             if not name.endswith("_iqr")))
+    return results
+
+
+def is_regression(metric, before_metrics, after_metrics, threshold_percent):
+    """
+    method to check if a metric regressed beyond the threshold. Timings must also exceed the noise floor and
+    IQR_TOLERANCE times the larger spread of both runs
+    """
+    before = before_metrics.get(metric)
+    after = after_metrics.get(metric)
+    if metric.endswith("_seconds"):
+        spread = max(before_metrics.get(metric + "_iqr", 0), after_metrics.get(metric + "_iqr", 0))
+        if after - before <= max(NOISE_FLOOR_SECONDS, IQR_TOLERANCE * spread):
+            return False
+    return before > 0 and (after - before) * 100.0 / before > threshold_percent
+
+
+def compare_results(baseline, results, threshold_percent):
+    """
+    Function to compare benchmark results against a baseline
+    :return: list of (case, metric) pairs regressing beyond the threshold, empty if none
+    """
+    regressions = []
+    for case, metrics in baseline.items():
+        for metric in COMPARED_METRICS:
+            if metric not in metrics or metric not in results.get(case, {}):
+                continue
+            if is_regression(metric, metrics, results.get(case), threshold_percent):
+                regressions.append((case, metric))
+    return regressions
+
+
+def confirm_regressions(baseline, results, regressions, threshold_percent):
+    """
+    Function to measure the cases with timing regressions again, dropping the ones that do not persist
+    :return: list of regression messages, timings reporting the smallest of the confirming measurements
+    """
+    confirmed = []
+    for case, metric in regressions:
+        engine, shape = case.split("/")
+        measurements = [results.get(case)]
+        if metric.endswith("_seconds"):
+            measurements = [benchmark_case(engine, shape) for run in range(CONFIRM_RUNS)]
+        if all(is_regression(metric, baseline.get(case), metrics, threshold_percent) for metrics in measurements):
+            before = baseline.get(case).get(metric)
+            after = min(metrics.get(metric) for metrics in measurements)
+            confirmed.append(f'{case} {metric}: {before:.6g} -> {after:.6g} '
+                             f'(+{(after - before) * 100.0 / before:.1f}%)')
+    return confirmed
+
+
+def main():
+    """
+    Main function for the generators benchmark
+
+    :param mode: run, to write a baseline file, or compare, to check the current tree against one
+    :param results_file: baseline file to write (run) or read (compare)
+    :param shapes_or_threshold: run takes optional <levels>x<threads>x<steps> shapes,
+                                compare takes an optional regression threshold in percent
+    :return: NA
+    """
+    if len(sys.argv) < 3 or sys.argv[1] not in ("run", "compare"):
+        print('...Usage: ' + sys.argv[0] + ' run <baseline-file>.json [<levels>x<threads>x<steps> ...]')
+        print('          ' + sys.argv[0] + ' compare <baseline-file>.json [<threshold-percent>]')
+        sys.exit(0)
+    results_file = sys.argv[2]
+    if sys.argv[1] == "run":
+        results = run_benchmarks(sys.argv[3:] or DEFAULT_SHAPES)
+        write_result(results_file, json.dumps(results, indent=2, sort_keys=True))
+        return
+    with open(results_file, encoding="utf-8") as json_file:
+        baseline = json.load(json_file)
+    threshold_percent = float(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_THRESHOLD_PERCENT
+    results = run_benchmarks(sorted({case.split("/")[1] for case in baseline}))
+    regressions = confirm_regressions(baseline, results, compare_results(baseline, results, threshold_percent),
+                                      threshold_percent)
+    for regression in regressions:
+        print('!Regression, ' + regression)
+    if regressions:
+        sys.exit(1)
+    print(f'No regression beyond {threshold_percent}%')
+
+
+if __name__ == "__main__":
+    main()
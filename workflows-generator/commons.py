@@ -14,6 +14,7 @@
 
 import sys
 import os
+import json
 
 def usage(args_expected, extension):
     """ method to explain usage"""
@@ -52,6 +53,50 @@ def read_template(template, generate_for_pipeline, templates_folder, file_extens
         raise err
 
 
+def timing_telemetry_enabled(exec_config):
+    """method to check if generated workflows should emit timing events"""
+    return str(exec_config.get("pTimingTelemetry", "False")).lower() == "true"
+
+
+def parse_seconds(value):
+    """method to read a duration in seconds, whole values as int so they are written as 30 and not 30.0"""
+    seconds = float(value)
+    return int(seconds) if seconds.is_integer() else seconds
+
+
+def read_duration_hints(exec_config):
+    """
+    Function to read the optional duration hints file written by timing_analyzer.py
+    :param exec_config: parameters, the hints file is taken from pDurationHintsFile
+    :return: dictionary of hints keyed by JOB_ID, empty if no hints file is configured
+    """
+    hints_file = exec_config.get("pDurationHintsFile")
+    if not hints_file:
+        return {}
+    try:
+        with open(hints_file, encoding="utf-8") as json_file:
+            return json.load(json_file)
+    except Exception as err:
+        print('Error reading duration hints file: ' + str(type(err)))
+        raise err
+
+
+def percentile(values, pct):
+    """method to compute a linearly interpolated percentile"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * pct / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def iqr(values):
+    """method to compute the interquartile range of values"""
+    return percentile(values, 75) - percentile(values, 25)
+
+
 def find_step_by_id(step_id, workflow_config):
     """method to find step by id"""
     for level in workflow_config:
@@ -96,6 +141,17 @@ def write_result(output_file, content):
         raise err
 
 
+def write_support_files(output_file, support_files):
+    """
+    Function to write the modules a generated file imports next to it
+    :param output_file: generated file
+    :param support_files: dictionary of file name to content
+    :return:
+    """
+    for file_name, content in support_files.items():
+        write_result(os.path.join(os.path.dirname(output_file), file_name), content)
+
+
 def assemble_cloud_function_id(name, exec_config):
     """
     Function to assemble cloud function ID
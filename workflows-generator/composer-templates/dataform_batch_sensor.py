@@ -0,0 +1,274 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# --------------------------------------------------------------------------------
+# Deferrable Dataform invocation sensor, batched per level.
+# Copied by the generator next to the DAGs using it, so the workers and the
+# triggerer import it from the DAGs folder.
+# --------------------------------------------------------------------------------
+
+import asyncio
+import json
+import logging
+import math
+import time
+from datetime import timedelta
+from airflow.exceptions import AirflowException
+from airflow.providers.google.cloud.hooks.dataform import DataformHook
+from airflow.sensors.base import BaseSensorOperator
+from airflow.triggers.base import BaseTrigger, TriggerEvent
+
+SUCCEEDED_STATES = {"SUCCEEDED"}
+FAILURE_STATES = {"FAILED", "CANCELLED"}
+# invocations listed per page, the list is filtered on the pending invocations so it needs one page per this many
+LIST_PAGE_SIZE = 100
+
+timing_logger = logging.getLogger("aef.timing")
+
+
+class DataformApiClient:
+    """Reads the state of workflow invocations through the Dataform API"""
+
+    def __init__(self, gcp_conn_id="google_cloud_default", impersonation_chain=None):
+        self.gcp_conn_id = gcp_conn_id
+        self.impersonation_chain = impersonation_chain
+
+    def list_invocation_states(self, project_id, region, repository_id, invocation_ids):
+        """
+        method to get the state of the given invocations of a repository. One list call, filtered on their names,
+        covers the invocations running together, so the repository history is never walked. No more pages are
+        read than the invocations need, and any invocation the list did not return is read with a get call
+        :return: dictionary of invocation id to state name, e.g. RUNNING or SUCCEEDED
+        """
+        client = DataformHook(gcp_conn_id=self.gcp_conn_id,
+                              impersonation_chain=self.impersonation_chain).get_dataform_client()
+        parent = f"projects/{project_id}/locations/{region}/repositories/{repository_id}"
+        names = sorted(f"{parent}/workflowInvocations/{invocation_id}" for invocation_id in invocation_ids)
+        request = {"parent": parent, "page_size": LIST_PAGE_SIZE,
+                   "filter": " OR ".join(f'name = "{name}"' for name in names)}
+        max_pages = math.ceil(len(names) / LIST_PAGE_SIZE)
+        states = {}
+        for page_number, page in enumerate(client.list_workflow_invocations(request=request).pages, 1):
+            for invocation in page.workflow_invocations:
+                invocation_id = invocation.name.split("/")[-1]
+                if invocation_id in invocation_ids:
+                    states[invocation_id] = invocation.state.name
+            if len(states) == len(invocation_ids) or page_number == max_pages:
+                break
+        for invocation_id in sorted(set(invocation_ids) - states.keys()):
+            invocation = client.get_workflow_invocation(name=f"{parent}/workflowInvocations/{invocation_id}")
+            states[invocation_id] = invocation.state.name
+        return states
+
+
+class FakeDataformClient:
+    """
+    In-memory DataformApiClient for local tests. Each invocation replays its list of states,
+    one per poll, and then stays on the last one. Every list call is recorded in calls.
+
+        client = FakeDataformClient({"inv-1": ["RUNNING", "SUCCEEDED"], "inv-2": ["FAILED"]})
+        trigger.client = client
+    """
+
+    def __init__(self, states):
+        self.states = {invocation_id: list(invocation_states) for invocation_id, invocation_states in states.items()}
+        self.calls = []
+
+    def list_invocation_states(self, project_id, region, repository_id, invocation_ids):
+        """method to get the next state of the given invocations, see DataformApiClient"""
+        self.calls.append((project_id, region, repository_id, sorted(invocation_ids)))
+        states = {}
+        for invocation_id in invocation_ids:
+            invocation_states = self.states[invocation_id]
+            states[invocation_id] = invocation_states.pop(0) if len(invocation_states) > 1 else invocation_states[0]
+        return states
+
+
+class DataformInvocationBatch:
+    """
+    Poll loop shared by the triggers of one level: every poll interval it reads the state of all the
+    pending invocations of the level with one bounded list call per repository, and releases each trigger
+    as soon as its invocation succeeds, fails or is cancelled
+    """
+
+    batches = {}
+
+    def __init__(self, batch_key, client, poll_interval):
+        self.batch_key = batch_key
+        self.client = client
+        self.poll_interval = poll_interval
+        # (project_id, region, repository_id) -> invocation id -> (future, on_poll) of the triggers waiting on it
+        self.waiters = {}
+        self.poll_task = None
+
+    @classmethod
+    def get(cls, batch_key, client, poll_interval):
+        """method to get the batch of a level, created by the first trigger of the level"""
+        if batch_key not in cls.batches:
+            cls.batches[batch_key] = cls(batch_key, client, poll_interval)
+        return cls.batches[batch_key]
+
+    async def wait(self, repository, invocation_id, on_poll=None):
+        """
+        method to wait for an invocation to finish
+        :param repository: tuple of project id, region and repository id
+        :param on_poll: optional function called with the state of the invocation on every poll
+        :return: final state name of the invocation
+        """
+        waiter = (asyncio.get_running_loop().create_future(), on_poll)
+        self.waiters.setdefault(repository, {}).setdefault(invocation_id, []).append(waiter)
+        if self.poll_task is None or self.poll_task.done():
+            self.poll_task = asyncio.create_task(self.poll())
+        try:
+            return await waiter[0]
+        finally:
+            self.remove_waiter(repository, invocation_id, waiter)
+
+    def remove_waiter(self, repository, invocation_id, waiter):
+        """method to forget a finished or cancelled trigger, stopping the loop once the level has none left"""
+        invocations = self.waiters.get(repository, {})
+        waiters = invocations.get(invocation_id, [])
+        if waiter in waiters:
+            waiters.remove(waiter)
+        if not waiters:
+            invocations.pop(invocation_id, None)
+        if not invocations:
+            self.waiters.pop(repository, None)
+        if not self.waiters:
+            if self.poll_task is not None and self.poll_task is not asyncio.current_task():
+                self.poll_task.cancel()
+            if DataformInvocationBatch.batches.get(self.batch_key) is self:
+                DataformInvocationBatch.batches.pop(self.batch_key)
+
+    async def poll(self):
+        """method to poll every pending invocation of the level until none is left"""
+        loop = asyncio.get_running_loop()
+        try:
+            while self.waiters:
+                for repository, invocations in list(self.waiters.items()):
+                    states = await loop.run_in_executor(None, self.client.list_invocation_states,
+                                                        *repository, set(invocations))
+                    for invocation_id, state in states.items():
+                        for future, on_poll in invocations.get(invocation_id, []):
+                            if on_poll is not None:
+                                on_poll(state)
+                            if (state in SUCCEEDED_STATES or state in FAILURE_STATES) and not future.done():
+                                future.set_result(state)
+                await asyncio.sleep(0)
+                if self.waiters:
+                    await asyncio.sleep(self.poll_interval)
+        except Exception as err:
+            for invocations in self.waiters.values():
+                for waiters in invocations.values():
+                    for future, on_poll in waiters:
+                        if not future.done():
+                            future.set_exception(err)
+
+
+class DataformBatchInvocationTrigger(BaseTrigger):
+    """Trigger waiting for one Dataform workflow invocation through the poll loop of its level"""
+
+    def __init__(self, batch_key, project_id, region, repository_id, workflow_invocation_id, poll_interval=60,
+                 gcp_conn_id="google_cloud_default", impersonation_chain=None, timing_fields=None):
+        super().__init__()
+        self.batch_key = batch_key
+        self.project_id = project_id
+        self.region = region
+        self.repository_id = repository_id
+        self.workflow_invocation_id = workflow_invocation_id
+        self.poll_interval = poll_interval
+        self.gcp_conn_id = gcp_conn_id
+        self.impersonation_chain = impersonation_chain
+        # fields of the job_poll timing events logged on every poll, None when timing telemetry is disabled
+        self.timing_fields = timing_fields
+        # set to a FakeDataformClient in local tests
+        self.client = None
+
+    def serialize(self):
+        return ("dataform_batch_sensor.DataformBatchInvocationTrigger", {
+            "batch_key": self.batch_key,
+            "project_id": self.project_id,
+            "region": self.region,
+            "repository_id": self.repository_id,
+            "workflow_invocation_id": self.workflow_invocation_id,
+            "poll_interval": self.poll_interval,
+            "gcp_conn_id": self.gcp_conn_id,
+            "impersonation_chain": self.impersonation_chain,
+            "timing_fields": self.timing_fields
+        })
+
+    async def run(self):
+        client = self.client or DataformApiClient(self.gcp_conn_id, self.impersonation_chain)
+        batch = DataformInvocationBatch.get(self.batch_key, client, self.poll_interval)
+        try:
+            state = await batch.wait((self.project_id, self.region, self.repository_id), self.workflow_invocation_id,
+                                     self.log_poll if self.timing_fields else None)
+        except Exception as err:
+            yield TriggerEvent({"workflow_invocation_id": self.workflow_invocation_id, "state": "ERROR",
+                                "message": str(err)})
+            return
+        yield TriggerEvent({"workflow_invocation_id": self.workflow_invocation_id, "state": state})
+
+    def log_poll(self, state):
+        """method to log a poll of the invocation as a timing event"""
+        status = "success" if state in SUCCEEDED_STATES else "failed" if state in FAILURE_STATES else "running"
+        timing_logger.info(json.dumps(dict(self.timing_fields, event="job_poll", status=status,
+                                           timestamp=time.time())))
+
+
+class DataformBatchInvocationSensor(BaseSensorOperator):
+    """
+    Deferrable sensor of a Dataform workflow invocation. It does not hold a worker slot while waiting:
+    it defers at once, and the sensors sharing a batch_key within a DAG run are polled together on the
+    triggerer. It succeeds as soon as its own invocation succeeds, so downstream tasks are released per job,
+    and fails as soon as the invocation is FAILED or CANCELLED.
+    """
+
+    template_fields = ("project_id", "region", "repository_id", "workflow_invocation_id")
+
+    def __init__(self, *, batch_key, project_id, region, repository_id, workflow_invocation_id, poll_interval=60,
+                 gcp_conn_id="google_cloud_default", impersonation_chain=None, timing_fields=None, **kwargs):
+        super().__init__(**kwargs)
+        self.batch_key = batch_key
+        self.project_id = project_id
+        self.region = region
+        self.repository_id = repository_id
+        self.workflow_invocation_id = workflow_invocation_id
+        self.poll_interval = poll_interval
+        self.gcp_conn_id = gcp_conn_id
+        self.impersonation_chain = impersonation_chain
+        # function returning the timing event fields of the task from its context, set by timing telemetry
+        self.timing_fields = timing_fields
+
+    def execute(self, context):
+        self.defer(
+            trigger=DataformBatchInvocationTrigger(
+                batch_key=f"{context['dag'].dag_id}/{context['run_id']}/{self.batch_key}",
+                project_id=self.project_id,
+                region=self.region,
+                repository_id=self.repository_id,
+                workflow_invocation_id=self.workflow_invocation_id,
+                poll_interval=self.poll_interval,
+                gcp_conn_id=self.gcp_conn_id,
+                impersonation_chain=self.impersonation_chain,
+                timing_fields=self.timing_fields(context) if self.timing_fields else None),
+            method_name="execute_complete",
+            timeout=timedelta(seconds=self.timeout))
+
+    def execute_complete(self, context, event):
+        """method called on the worker once the trigger fires"""
+        if event["state"] not in SUCCEEDED_STATES:
+            raise AirflowException(f"Dataform workflow invocation {event['workflow_invocation_id']} "
+                                   f"ended as {event['state']} {event.get('message', '')}".strip())
+        return event["workflow_invocation_id"]
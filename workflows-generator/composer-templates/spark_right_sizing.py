@@ -0,0 +1,40 @@
+
+# --------------------------------------------------------------------------------
+# Resource right-sizing: applies the executor recommendations of right_sizing.py
+# over the Spark properties of the job parameters files
+# --------------------------------------------------------------------------------
+
+# Dataproc Serverless limit of spark.executor.memory plus spark.executor.memoryOverhead per executor core
+SPARK_MAX_MEMORY_MB_PER_CORE = 7424
+SPARK_DEFAULT_EXECUTOR_CORES = 4
+# Spark default overhead: 10% of the executor memory, at least 384 MB
+SPARK_OVERHEAD_FACTOR = 0.1
+SPARK_MIN_OVERHEAD_MB = 384
+
+def spark_memory_mb(value):
+    """Converts a Spark memory size, e.g. 4g, 512m or 2048 (MB), to MB."""
+    value = str(value).strip().lower().rstrip('b')
+    units = {'k': 1.0 / 1024, 'm': 1, 'g': 1024, 't': 1024 * 1024}
+    if value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+def right_size_spark_properties(properties, executors, memory_gb):
+    """
+    Returns the Spark properties of a job with the recommended executors and executor memory. The memory is
+    capped so that, with the job's executor cores and memory overhead, the executor stays within the Dataproc
+    Serverless limit per core, and minimum and initial executors are kept within the new maximum.
+    """
+    properties = dict(properties)
+    limit_mb = int(properties.get('spark.executor.cores', SPARK_DEFAULT_EXECUTOR_CORES)) * SPARK_MAX_MEMORY_MB_PER_CORE
+    if 'spark.executor.memoryOverhead' in properties:
+        max_memory_mb = limit_mb - spark_memory_mb(properties['spark.executor.memoryOverhead'])
+    else:
+        max_memory_mb = min(int(limit_mb / (1 + SPARK_OVERHEAD_FACTOR)), limit_mb - SPARK_MIN_OVERHEAD_MB)
+    properties['spark.executor.memory'] = str(min(memory_gb * 1024, max_memory_mb)) + 'm'
+    properties['spark.executor.instances'] = str(executors)
+    properties['spark.dynamicAllocation.maxExecutors'] = str(executors)
+    for key in ('spark.dynamicAllocation.minExecutors', 'spark.dynamicAllocation.initialExecutors'):
+        if key in properties and int(properties[key]) > executors:
+            properties[key] = str(executors)
+    return properties
@@ -0,0 +1,45 @@
+
+# --------------------------------------------------------------------------------
+# Timing telemetry: one structured log line per task start/end, job launch and
+# sensor poll, keyed by job, level and thread. Consumed by
+# workflows-generator/timing_analyzer.py
+# --------------------------------------------------------------------------------
+import logging
+import time
+
+timing_logger = logging.getLogger("aef.timing")
+
+def timing_event_fields(context):
+    """Returns the fields identifying the job of a task living inside a Level/Thread/Job task group."""
+    task_instance = context['task_instance']
+    group_ids = task_instance.task_id.split('.')
+    if len(group_ids) < 4:
+        return None
+    job_name = group_ids[2]
+    return {
+        "telemetry": "aef_timing",
+        "workflow_name": task_instance.dag_id,
+        "run_id": context['run_id'],
+        "job_id": timing_job_ids.get(job_name, job_name),
+        "job_name": job_name,
+        "level_id": group_ids[0].replace('Level_', ''),
+        "thread_id": group_ids[1].split('_Thread_')[-1],
+        "task_id": group_ids[-1]
+    }
+
+def emit_timing_event(event, context, status=None):
+    """Logs a timing event for tasks living inside a Level/Thread/Job task group."""
+    fields = timing_event_fields(context)
+    if fields is None:
+        return
+    timing_logger.info(json.dumps(dict(fields, event=event, status=status, timestamp=time.time())))
+
+def emit_task_success_events(context):
+    """Logs the end of a task and, for the task launching the job, the launch."""
+    emit_timing_event('task_end', context, 'success')
+    if context['task_instance'].task_id.split('.')[-1] in timing_launch_task_ids:
+        emit_timing_event('job_launched', context)
+
+default_args['on_execute_callback'] = lambda context: emit_timing_event('task_start', context)
+default_args['on_success_callback'] = emit_task_success_events
+default_args['on_failure_callback'] = lambda context: emit_timing_event('task_end', context, 'failed')
@@ -29,7 +29,6 @@ from airflow.utils.task_group import TaskGroup
 from airflow.providers.google.cloud.operators.bigquery import  BigQueryInsertJobOperator
 from airflow.operators.empty import EmptyOperator
 from airflow.operators.python import PythonOperator
-from airflow.providers.google.cloud.sensors.dataform import DataformWorkflowInvocationStateSensor
 from airflow.providers.google.cloud.operators.dataform import (
     DataformCreateCompilationResultOperator,
     DataformCreateWorkflowInvocationOperator,
@@ -39,7 +38,6 @@ from airflow.providers.google.cloud.operators.dataproc import (
     DataprocGetBatchOperator
 )
 from airflow.providers.google.cloud.sensors.dataproc import DataprocBatchSensor
-from google.cloud.dataform_v1beta1 import WorkflowInvocation
 from google.cloud import storage
 from datetime import datetime, timedelta
 
@@ -51,6 +49,9 @@ jobs_bucket = Variable.get("DATA_TRANSFORMATION_GCS_BUCKET")
 
 batch_id = f"aef-{str(uuid.uuid4())}"
 
+def push_batch_id_to_xcom(**context):
+    context['task_instance'].xcom_push(key='batch-id', value=batch_id)
+
 def extract_job_params(job_name, function_name, encoding='utf-8'):
     """Extracts parameters from a JSON job file.
 
@@ -94,34 +95,5 @@ default_args = {
     'retry_delay': timedelta(minutes=5)
 }
 
-<<STEPS_ARGS>>
-
 start_date_str = yesterday.strftime('%Y-%m-%d')
 end_date_str = datetime.today().strftime('%Y-%m-%d')
-# --------------------------------------------------------------------------------
-# Main DAG
-# --------------------------------------------------------------------------------
-
-with models.DAG(
-        '<<DAG_NAME>>',
-        default_args=default_args,
-        params={
-            "start_date_str": start_date_str,
-            "end_date_str": end_date_str
-        },
-        catchup=False,
-        schedule_interval=None) as dag:
-
-    start = empty.EmptyOperator(
-        task_id='start',
-        trigger_rule='all_success'
-    )
-
-    <<LEVELS>>
-
-    end = empty.EmptyOperator(
-        task_id='end',
-        trigger_rule='all_success'
-    )
-
-    start >> <<LEVEL_DEPENDENCIES>> >> end
\ No newline at end of file
@@ -0,0 +1,194 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import re
+from contextlib import contextmanager
+from functools import lru_cache
+
+YAML_PLAIN_STRING = re.compile(r"^[A-Za-z_][\w.\-/]*$")
+YAML_RESERVED_WORDS = {"true", "false", "yes", "no", "on", "off", "null", "y", "n"}
+
+
+def yaml_scalar(value):
+    """method to serialise a scalar as YAML, quoting strings unless they are plain identifiers"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return yaml_string(value)
+
+
+@lru_cache(maxsize=4096)
+def yaml_string(value):
+    """method to serialise a string as YAML, cached as step keys and names repeat throughout a workflow"""
+    if YAML_PLAIN_STRING.match(value) and value.lower() not in YAML_RESERVED_WORDS:
+        return value
+    return json.dumps(value)
+
+
+def write_yaml(value, indent, first_prefix, lines):
+    """
+    method to append a dict or list as block style YAML lines
+    :param first_prefix: text starting the first line instead of the indentation, e.g. a list dash
+    """
+    prefix = first_prefix
+    padding = " " * indent
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if isinstance(item, (dict, list)) and item:
+                lines.append(prefix + yaml_scalar(key) + ":")
+                write_yaml(item, indent + 2, " " * (indent + 2), lines)
+            else:
+                lines.append(prefix + yaml_scalar(key) + ": " + to_yaml_flow(item))
+            prefix = padding
+    else:
+        for item in value:
+            if isinstance(item, (dict, list)) and item:
+                write_yaml(item, indent + 2, prefix + "- ", lines)
+            else:
+                lines.append(prefix + "- " + to_yaml_flow(item))
+            prefix = padding
+
+
+def to_yaml_flow(value):
+    """method to serialise a scalar or an empty collection on a single line"""
+    if isinstance(value, dict):
+        return "{}"
+    if isinstance(value, list):
+        return "[" + ", ".join(yaml_scalar(item) for item in value) + "]"
+    return yaml_scalar(value)
+
+
+def to_yaml(value):
+    """
+    Function to serialise structured data (dicts, lists and scalars) as a YAML document
+    :param value: dict or list
+    :return: YAML text
+    """
+    lines = []
+    write_yaml(value, 0, "", lines)
+    return "\n".join(lines) + "\n"
+
+
+class PythonExpression:
+    """Python code emitted verbatim, e.g. a reference to a variable of the generated module"""
+
+    def __init__(self, code):
+        self.code = code
+
+
+def write_python(value, indent, parts):
+    """method to append the parts of a Python literal, see to_python"""
+    if isinstance(value, PythonExpression):
+        parts.append(value.code)
+    elif isinstance(value, dict):
+        if not value:
+            parts.append("{}")
+            return
+        padding = " " * (indent + 4)
+        separator = "{\n"
+        for key, item in value.items():
+            parts.append(separator)
+            parts.append(padding)
+            write_python(key, indent + 4, parts)
+            parts.append(": ")
+            write_python(item, indent + 4, parts)
+            separator = ",\n"
+        parts.append("\n" + " " * indent + "}")
+    elif isinstance(value, (list, tuple)):
+        opening, closing = {list: "[]", tuple: "()"}[type(value)]
+        parts.append(opening)
+        for index, item in enumerate(value):
+            if index:
+                parts.append(", ")
+            write_python(item, indent, parts)
+        parts.append(("," if isinstance(value, tuple) and len(value) == 1 else "") + closing)
+    elif isinstance(value, str):
+        parts.append(json.dumps(value))
+    else:
+        parts.append(repr(value))
+
+
+def to_python(value, indent=0):
+    """
+    Function to serialise structured data as a Python literal
+    :param value: dict, list, tuple, scalar or PythonExpression
+    :param indent: indentation of the line the literal starts on
+    :return: Python code
+    """
+    parts = []
+    write_python(value, indent, parts)
+    return "".join(parts)
+
+
+class PythonTask:
+    """An operator instantiation of the generated DAG: variable = operator(**arguments)"""
+
+    def __init__(self, variable, operator, arguments):
+        self.variable = variable
+        self.operator = operator
+        self.arguments = arguments
+
+
+class PythonAssignment:
+    """A variable assignment of the generated DAG: variable = value"""
+
+    def __init__(self, variable, value):
+        self.variable = variable
+        self.value = value
+
+
+class PythonWriter:
+    """Accumulates Python lines, tracking the indentation of nested blocks"""
+
+    def __init__(self):
+        self.lines = []
+        self.indent = 0
+
+    def line(self, code=""):
+        """method to add a line at the current indentation"""
+        self.lines.append(" " * self.indent + code if code else "")
+
+    @contextmanager
+    def block(self, header):
+        """context manager for a block statement, e.g. with or for, indenting the lines added inside"""
+        self.line(header)
+        self.indent += 4
+        try:
+            yield
+        finally:
+            self.indent -= 4
+
+    def call(self, prefix, arguments, suffix=""):
+        """method to add a call with one keyword argument per line"""
+        self.line(prefix + "(")
+        for index, (name, value) in enumerate(arguments.items()):
+            separator = "," if index < len(arguments) - 1 else ""
+            argument = to_python(value, self.indent + 4)
+            self.line("    " + (argument if name is None else name + "=" + argument) + separator)
+        self.line(")" + suffix)
+
+    def statement(self, statement):
+        """method to add a PythonTask or PythonAssignment"""
+        if isinstance(statement, PythonTask):
+            self.call(statement.variable + " = " + statement.operator, statement.arguments)
+        else:
+            self.line(statement.variable + " = " + to_python(statement.value, self.indent))
+
+    def text(self):
+        """method to get the generated code"""
+        return "\n".join(self.lines) + "\n"
@@ -16,6 +16,7 @@ import json
 from commons import *
 from ComposerDagGenerator import ComposerDagGenerator
 from WorkflowsGenerator import WorkflowsGenerator
+from profiling import GenerationProfiler
 
 def main():
     """
@@ -25,12 +26,17 @@ def main():
     :param config_file: Json parameters file
     :param output_file: Cloud Workflows generated file
     :param generate_for_pipeline: Boolean to identify if the run is part of a CICD pipeline
+    :param --profile[=<output-dir>]: optional, prints a phase breakdown and writes pstats and JSON metrics
+                                     to output-dir, also enabled by the AEF_GENERATOR_PROFILE variable
     :return: NA
     """
+    profiler = GenerationProfiler.from_options(sys.argv)
+    profiler.start()
     encoding = "utf-8"
     workflow_file = sys.argv[1]
-    with open(workflow_file, encoding=encoding) as json_file:
-        workflow_config = json.load(json_file)
+    with profiler.phase("load_definition"):
+        with open(workflow_file, encoding=encoding) as json_file:
+            workflow_config = json.load(json_file)
     if workflow_config.get("engine") == 'cloud_workflows':
         usage(4,'json')
     else:
@@ -40,25 +46,32 @@ def main():
     output_file = sys.argv[3]
     generate_for_pipeline = bool(sys.argv[4])
 
-    if generate_for_pipeline:
-        with open(os.path.dirname(__file__) + '/' + config_file, encoding=encoding) as json_file:
-            exec_config = json.load(json_file)
-    else:
-        with open(os.getcwd() + '/' + config_file, encoding=encoding) as json_file:
-            exec_config = json.load(json_file)
-    exec_config = process_config_key_values(exec_config)
+    with profiler.phase("load_parameters"):
+        if generate_for_pipeline:
+            with open(os.path.dirname(__file__) + '/' + config_file, encoding=encoding) as json_file:
+                exec_config = json.load(json_file)
+        else:
+            with open(os.getcwd() + '/' + config_file, encoding=encoding) as json_file:
+                exec_config = json.load(json_file)
+    with profiler.phase("process_config_key_values"):
+        exec_config = process_config_key_values(exec_config)
     generator = None
+    engine = workflow_config.get("engine")
     if workflow_config.get("engine") == 'cloud_workflows':
         workflow_config = workflow_config.get("definition")
         generator = WorkflowsGenerator(workflow_config, exec_config, generate_for_pipeline, config_file)
+        profiler.instrument(generator)
         generator.load_templates()
     elif workflow_config.get("engine") == 'composer':
         workflow_config = workflow_config.get("definition")
         generator = ComposerDagGenerator(workflow_config, exec_config,
                                          generate_for_pipeline, config_file, json_file_name)
+        profiler.instrument(generator)
         generator.load_templates()
     workflow_body = generator.generate_workflows_body()
-    write_result(output_file, workflow_body)
-
+    with profiler.phase("write_result"):
+        write_result(output_file, workflow_body)
+        write_support_files(output_file, generator.support_files)
+    profiler.report(json_file_name, engine)
 
 main()
\ No newline at end of file
@@ -0,0 +1,142 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class JobNode:
+    """A STEP of the definition: one job with its executor config and its outgoing edge"""
+
+    def __init__(self, step, level, thread):
+        self.step = step
+        self.job_id = step.get("JOB_ID")
+        self.job_name = step.get("JOB_NAME")
+        self.type = step.get("TYPE")
+        self.executor = step.get("COMPOSER_STEP") or step.get("FUNCTION_ID_NAME")
+        self.level = level
+        self.thread = thread
+        # next job to run, None when the thread ends after this job
+        self.next = None
+
+
+class ThreadGroup:
+    """A THREAD: jobs running one after the other"""
+
+    def __init__(self, thread_id, level):
+        self.thread_id = thread_id
+        self.level = level
+        self.nodes = []
+
+
+class LevelGroup:
+    """A LEVEL: threads running in parallel, all finishing before the next level starts"""
+
+    def __init__(self, level_id):
+        self.level_id = level_id
+        self.threads = []
+        self.next_level = None
+        # False once merge_groups has folded a single thread level into its thread
+        self.parallel = True
+
+
+class Pipeline:
+    """Engine neutral representation of a definition, built once and lowered by each generator"""
+
+    def __init__(self):
+        self.levels = []
+        self.nodes_by_id = {}
+
+    def nodes(self):
+        """method to iterate over every job node in definition order"""
+        for level in self.levels:
+            for thread in level.threads:
+                yield from thread.nodes
+
+
+def build_pipeline(workflow_config):
+    """
+    Function to build the pipeline IR of a definition
+    :param workflow_config: "definition" list of a workflow definition file (levels, threads and steps)
+    :return: Pipeline with every edge resolved
+    """
+    pipeline = Pipeline()
+    for level_config in workflow_config:
+        level = LevelGroup(level_config.get("LEVEL_ID"))
+        if pipeline.levels:
+            pipeline.levels[-1].next_level = level
+        pipeline.levels.append(level)
+        for thread_config in level_config.get("THREADS"):
+            thread = ThreadGroup(thread_config.get("THREAD_ID"), level)
+            level.threads.append(thread)
+            for step in thread_config.get("STEPS"):
+                node = JobNode(step, level, thread)
+                thread.nodes.append(node)
+                pipeline.nodes_by_id[node.job_id] = node
+    for thread in [thread for level in pipeline.levels for thread in level.threads]:
+        for index, node in enumerate(thread.nodes):
+            if "NEXT" in node.step.keys():
+                if node.step.get("NEXT") not in pipeline.nodes_by_id:
+                    raise ValueError("NEXT job " + node.step.get("NEXT") + " of " + node.job_id + " does not exist")
+                node.next = pipeline.nodes_by_id[node.step.get("NEXT")]
+            elif index + 1 < len(thread.nodes):
+                node.next = thread.nodes[index + 1]
+    return pipeline
+
+
+def eliminate_dead_steps(pipeline):
+    """Pass removing, with a warning, the jobs no thread can reach because NEXT jumps skip them"""
+    reachable = set()
+    for level in pipeline.levels:
+        for thread in level.threads:
+            node = thread.nodes[0]
+            while node is not None and node not in reachable:
+                reachable.add(node)
+                node = node.next
+    removed = [node.job_id for node in pipeline.nodes() if node not in reachable]
+    if removed:
+        print('!Warning, jobs not reached through NEXT by any thread are not generated: ' + ', '.join(removed))
+    for level in pipeline.levels:
+        for thread in level.threads:
+            thread.nodes = [node for node in thread.nodes if node in reachable]
+    pipeline.nodes_by_id = {job_id: node for job_id, node in pipeline.nodes_by_id.items() if node in reachable}
+
+
+def flatten_branches(pipeline):
+    """Pass ordering the jobs of each thread by execution order, so NEXT jumps inside a thread become sequential"""
+    for level in pipeline.levels:
+        for thread in level.threads:
+            ordered = []
+            visited = set()
+            node = thread.nodes[0]
+            while node is not None and node.thread is thread and node not in visited:
+                ordered.append(node)
+                visited.add(node)
+                node = node.next
+            thread.nodes = ordered + [node for node in thread.nodes if node not in visited]
+
+
+def merge_groups(pipeline):
+    """Pass folding single thread levels into their thread, as there is nothing to run in parallel"""
+    for level in pipeline.levels:
+        level.parallel = len(level.threads) > 1
+
+
+def optimize_pipeline(pipeline):
+    """
+    Function to run the optimisation passes shared by every engine
+    :param pipeline: Pipeline returned by build_pipeline
+    :return: the same pipeline, optimised in place
+    """
+    eliminate_dead_steps(pipeline)
+    flatten_branches(pipeline)
+    merge_groups(pipeline)
+    return pipeline
@@ -0,0 +1,131 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cProfile
+import json
+import time
+from contextlib import contextmanager
+from commons import *
+
+PROFILE_OPTION = "--profile"
+PROFILE_ENV_VARIABLE = "AEF_GENERATOR_PROFILE"
+GENERATOR_METHODS = ["load_templates", "generate_workflows_body", "build_pipeline", "process_levels",
+                     "process_threads", "process_steps", "process_next_step"]
+
+
+class GenerationProfiler:
+    """
+    Phase timing for orchestration_generator.py. When disabled nothing is wrapped and
+    phase() only checks a flag, so it can stay in place in CI pipelines.
+    """
+
+    def __init__(self, enabled=False, output_dir=None):
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.timings = {}
+        self.started = None
+        self.cprofile = None
+
+    @classmethod
+    def from_options(cls, argv):
+        """
+        method to build a profiler from the --profile[=<output-dir>] option, removed from argv,
+        or from the AEF_GENERATOR_PROFILE environment variable (true or an output directory)
+        """
+        value = os.environ.get(PROFILE_ENV_VARIABLE, "")
+        for argument in list(argv):
+            if argument == PROFILE_OPTION or argument.startswith(PROFILE_OPTION + "="):
+                argv.remove(argument)
+                value = argument.partition("=")[2] or "true"
+        if value.lower() in ("", "0", "false", "no"):
+            return cls()
+        if value.lower() in ("1", "true", "yes"):
+            return cls(True)
+        return cls(True, value)
+
+    def start(self):
+        """method to start timing, and cProfile when an output directory is set"""
+        if not self.enabled:
+            return
+        self.started = time.perf_counter()
+        if self.output_dir:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def record(self, name, elapsed):
+        """method to add a call of the given phase or method"""
+        timing = self.timings.setdefault(name, [0, 0.0])
+        timing[0] += 1
+        timing[1] += elapsed
+
+    @contextmanager
+    def phase(self, name):
+        """context manager timing a phase of the generation"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def wrap(self, name, function):
+        """method to wrap a function so every call is recorded under name"""
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return timed
+
+    def instrument(self, generator):
+        """method to time the generator methods and the read_template calls of its module"""
+        if not self.enabled:
+            return
+        for name in GENERATOR_METHODS:
+            if hasattr(generator, name):
+                setattr(generator, name, self.wrap(name, getattr(generator, name)))
+        generator_module = sys.modules[type(generator).__module__]
+        generator_module.read_template = self.wrap("read_template", generator_module.read_template)
+
+    def report(self, definition_name, engine):
+        """
+        method to print the phase breakdown and write the pstats and JSON metrics files
+        :param definition_name: name of the definition file, used to name the output files
+        :param engine: engine of the definition
+        :return: NA
+        """
+        if not self.enabled:
+            return
+        total = time.perf_counter() - self.started
+        if self.cprofile:
+            self.cprofile.disable()
+        print(f'Generation profile for {definition_name} ({engine}), total {total:.6f}s')
+        print(f'{"PHASE":<28}{"CALLS":>8}{"CUMULATIVE(s)":>16}')
+        for name, (calls, cumulative) in self.timings.items():
+            print(f'{name:<28}{calls:>8}{cumulative:>16.6f}')
+        if not self.output_dir:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.cprofile.dump_stats(os.path.join(self.output_dir, definition_name + ".pstats"))
+        metrics = {
+            "definition": definition_name,
+            "engine": engine,
+            "total_seconds": total,
+            "phases": {name: {"calls": calls, "cumulative_seconds": cumulative}
+                       for name, (calls, cumulative) in self.timings.items()}
+        }
+        write_result(os.path.join(self.output_dir, definition_name + ".profile.json"), json.dumps(metrics, indent=2))
@@ -0,0 +1,183 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import math
+from commons import *
+
+# most recent runs of a job taken into account
+HISTORY_WINDOW = 10
+# percentile of the input size a job is sized for, so heavy runs still finish within the target
+INPUT_PERCENTILE = 90
+# executor memory, in GB, per GB of the executor's share of the input, leaving room for shuffle and caching
+SPARK_MEMORY_PER_INPUT_GB = 2
+GIGABYTE = 1024 ** 3
+# parameter -> default of the right-sizing bounds, overridable in the parameters file
+RIGHT_SIZING_PARAMETERS = {
+    "pRightSizingTargetSeconds": 1800,
+    "pDataflowMinWorkers": 1,
+    "pDataflowMaxWorkers": 100,
+    "pSparkMinExecutors": 2,
+    "pSparkMaxExecutors": 100,
+    "pSparkMinExecutorMemoryGb": 4,
+    "pSparkMaxExecutorMemoryGb": 28
+}
+
+
+def read_run_history(history_file):
+    """
+    Function to read a run history file
+    :param history_file: JSONL file, oldest run first, one run per line with job_id, input_bytes, duration_seconds
+                         and either peak_workers (Dataflow) or executor_count (Spark)
+    :return: dictionary of runs keyed by job_id
+    """
+    runs_by_job = {}
+    with open(history_file, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            run = json.loads(line)
+            runs_by_job.setdefault(str(run.get("job_id")), []).append(run)
+    return runs_by_job
+
+
+def right_sizing_bounds(exec_config):
+    """method to get the target duration and resource bounds, from the parameters or their defaults"""
+    return {parameter: int(exec_config.get(parameter, default))
+            for parameter, default in RIGHT_SIZING_PARAMETERS.items()}
+
+
+def clamp(value, lower, upper):
+    """method to bound a value"""
+    return max(lower, min(upper, value))
+
+
+def recommend_units(runs, units_field, target_seconds):
+    """
+    Function to size the workers or executors of a job from its runs, assuming throughput per unit stays the same
+    :param runs: runs of the job having units_field
+    :param units_field: peak_workers or executor_count
+    :param target_seconds: duration the job should finish in
+    :return: tuple of expected input bytes, observed units and units needed to process it within target_seconds
+    """
+    throughputs = [run.get("input_bytes") / (run.get("duration_seconds") * run.get(units_field)) for run in runs]
+    expected_input = percentile([run.get("input_bytes") for run in runs], INPUT_PERCENTILE)
+    observed_units = percentile([run.get(units_field) for run in runs], 50)
+    units = math.ceil(expected_input / (percentile(throughputs, 50) * target_seconds))
+    return expected_input, observed_units, units
+
+
+def recommend_job(runs, bounds):
+    """
+    Function to get the resource recommendation of a job
+    :param runs: runs of the job, oldest first
+    :param bounds: bounds returned by right_sizing_bounds
+    :return: recommendation dictionary, None if no run has usable values
+    """
+    for units_field in ("peak_workers", "executor_count"):
+        # runs missing a value, or recording it as null or zero, tell nothing about throughput
+        usable_runs = [run for run in runs[-HISTORY_WINDOW:]
+                       if (run.get(units_field) or 0) > 0 and (run.get("duration_seconds") or 0) > 0
+                       and (run.get("input_bytes") or 0) > 0]
+        if not usable_runs:
+            continue
+        expected_input, observed_units, units = recommend_units(usable_runs, units_field,
+                                                                bounds.get("pRightSizingTargetSeconds"))
+        recommendation = {"runs": len(usable_runs), "expected_input_bytes": int(expected_input)}
+        if units_field == "peak_workers":
+            recommendation["observed_workers"] = observed_units
+            recommendation["dataflow_max_workers"] = clamp(units, bounds.get("pDataflowMinWorkers"),
+                                                           bounds.get("pDataflowMaxWorkers"))
+        else:
+            executors = clamp(units, bounds.get("pSparkMinExecutors"), bounds.get("pSparkMaxExecutors"))
+            memory_gb = math.ceil(SPARK_MEMORY_PER_INPUT_GB * expected_input / executors / GIGABYTE)
+            recommendation["observed_executors"] = observed_units
+            recommendation["spark_executor_instances"] = executors
+            recommendation["spark_executor_memory_gb"] = clamp(memory_gb, bounds.get("pSparkMinExecutorMemoryGb"),
+                                                               bounds.get("pSparkMaxExecutorMemoryGb"))
+        return recommendation
+    return None
+
+
+def build_recommendations(runs_by_job, bounds):
+    """
+    Function to get the resource recommendations of every job of a run history
+    :return: dictionary of recommendations keyed by job_id
+    """
+    recommendations = {}
+    for job_id, runs in runs_by_job.items():
+        recommendation = recommend_job(runs, bounds)
+        if recommendation is not None:
+            recommendations[job_id] = recommendation
+    return recommendations
+
+
+def read_resource_recommendations(exec_config):
+    """
+    Function to compute the resource recommendations applied by the generators
+    :param exec_config: parameters, the history is taken from pRunHistoryFile and the bounds from the
+                        RIGHT_SIZING_PARAMETERS. With pRightSizingMode set to report, recommendations are
+                        only printed
+    :return: dictionary of recommendations keyed by JOB_ID, empty if no run history is configured
+    """
+    history_file = exec_config.get("pRunHistoryFile")
+    if not history_file:
+        return {}
+    recommendations = build_recommendations(read_run_history(history_file), right_sizing_bounds(exec_config))
+    if str(exec_config.get("pRightSizingMode", "apply")).lower() == "report":
+        print_report(recommendations)
+        return {}
+    return recommendations
+
+
+def print_report(recommendations):
+    """method to print the recommendations as a table"""
+    print(f'{"JOB_ID":<12}{"RUNS":>6}{"INPUT(GB)":>12}{"OBSERVED":>10}  RECOMMENDED')
+    for job_id, recommendation in sorted(recommendations.items()):
+        input_gb = recommendation.get("expected_input_bytes") / GIGABYTE
+        if "dataflow_max_workers" in recommendation:
+            observed = recommendation.get("observed_workers")
+            recommended = f'maxWorkers={recommendation.get("dataflow_max_workers")}'
+        else:
+            observed = recommendation.get("observed_executors")
+            recommended = (f'executors={recommendation.get("spark_executor_instances")} '
+                           f'memory={recommendation.get("spark_executor_memory_gb")}g')
+        print(f'{job_id:<12}{recommendation.get("runs"):>6}{input_gb:>12.2f}{observed:>10g}  {recommended}')
+
+
+def main():
+    """
+    Main function for the right-sizing report
+
+    :param history_file: run history (JSONL) with per-job input size, duration, peak workers or executor count
+    :param report_file: optional JSON report to write, keyed by JOB_ID
+    :param config_file: optional parameters file overriding the target duration and resource bounds
+    :return: NA
+    """
+    if len(sys.argv) < 2:
+        print('...Usage: ' + sys.argv[0] + ' <run-history>.jsonl [<report-file>.json] [<parameters-file>.json]')
+        sys.exit(0)
+    exec_config = {}
+    if len(sys.argv) > 3:
+        with open(sys.argv[3], encoding="utf-8") as json_file:
+            exec_config = process_config_key_values(json.load(json_file))
+    recommendations = build_recommendations(read_run_history(sys.argv[1]), right_sizing_bounds(exec_config))
+    print_report(recommendations)
+    if len(sys.argv) > 2:
+        write_result(sys.argv[2], json.dumps(recommendations, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Offline checks of the level batched Dataform sensor (composer-templates/dataform_batch_sensor.py):
+# the poll loop against FakeDataformClient and DataformApiClient against a fake API pager.
+# Airflow is stubbed when it is not installed, so it runs anywhere:
+#   python3 test_dataform_batch_sensor.py
+
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import re
+import sys
+import types
+
+POLL_INTERVAL = 0.01
+
+
+def stub_airflow():
+    """method to register minimal airflow modules when airflow is not installed"""
+    if importlib.util.find_spec("airflow") is not None:
+        return
+
+    class BaseTrigger:
+        def __init__(self, **kwargs):
+            pass
+
+    class TriggerEvent:
+        def __init__(self, payload):
+            self.payload = payload
+
+    class BaseSensorOperator:
+        def __init__(self, **kwargs):
+            self.timeout = kwargs.get("timeout", 60)
+
+    modules = {
+        "airflow.exceptions": {"AirflowException": Exception},
+        "airflow.providers.google.cloud.hooks.dataform": {"DataformHook": object},
+        "airflow.sensors.base": {"BaseSensorOperator": BaseSensorOperator},
+        "airflow.triggers.base": {"BaseTrigger": BaseTrigger, "TriggerEvent": TriggerEvent}
+    }
+    for module_name, attributes in modules.items():
+        parts = module_name.split(".")
+        for index in range(1, len(parts) + 1):
+            sys.modules.setdefault(".".join(parts[:index]), types.ModuleType(".".join(parts[:index])))
+        sys.modules[module_name].__dict__.update(attributes)
+
+
+stub_airflow()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "composer-templates"))
+import dataform_batch_sensor
+from dataform_batch_sensor import (DataformApiClient, DataformBatchInvocationTrigger, DataformInvocationBatch,
+                                   FakeDataformClient, timing_logger)
+
+
+class RecordingHandler(logging.Handler):
+    """Keeps the records logged by the sensor"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class FakeDataformApi:
+    """
+    Dataform API client serving a repository history in server order, one page at a time. It applies the name
+    filter of list requests, unless apply_filter is False, and records the pages read and the get calls
+    """
+
+    def __init__(self, history, apply_filter=True):
+        # list of (invocation id, state name), in the order the server lists them
+        self.history = history
+        self.apply_filter = apply_filter
+        self.requests = []
+        self.pages_read = 0
+        self.gets = []
+
+    def list_workflow_invocations(self, request):
+        self.requests.append(request)
+        invocations = [self.invocation(request["parent"], invocation_id, state) for invocation_id, state in self.history]
+        if self.apply_filter:
+            names = set(re.findall(r'name = "([^"]+)"', request.get("filter", "")))
+            invocations = [invocation for invocation in invocations if invocation.name in names]
+        return types.SimpleNamespace(pages=self.pages(invocations, request["page_size"]))
+
+    def pages(self, invocations, page_size):
+        for start in range(0, len(invocations), page_size):
+            self.pages_read += 1
+            yield types.SimpleNamespace(workflow_invocations=invocations[start:start + page_size])
+
+    def get_workflow_invocation(self, name):
+        self.gets.append(name.split("/")[-1])
+        return self.invocation(name.rsplit("/", 2)[0], name.split("/")[-1], dict(self.history)[name.split("/")[-1]])
+
+    def invocation(self, parent, invocation_id, state):
+        return types.SimpleNamespace(name=f"{parent}/workflowInvocations/{invocation_id}",
+                                     state=types.SimpleNamespace(name=state))
+
+
+def list_states(api, invocation_ids):
+    """method to list invocation states through DataformApiClient, its hook returning the given API client"""
+    class FakeHook:
+        def __init__(self, **kwargs):
+            pass
+
+        def get_dataform_client(self):
+            return api
+
+    hook = dataform_batch_sensor.DataformHook
+    dataform_batch_sensor.DataformHook = FakeHook
+    try:
+        return DataformApiClient().list_invocation_states("project", "region", "repository", set(invocation_ids))
+    finally:
+        dataform_batch_sensor.DataformHook = hook
+
+
+def create_trigger(client, invocation_id, repository_id="repository", batch_key="dag/run/Level_1"):
+    """method to create a trigger polling through the fake client"""
+    trigger = DataformBatchInvocationTrigger(batch_key, "project", "region", repository_id, invocation_id,
+                                             poll_interval=POLL_INTERVAL)
+    trigger.client = client
+    return trigger
+
+
+async def run_level(client, invocations):
+    """
+    Function to run the triggers of a level together
+    :param invocations: dictionary of invocation id to repository id
+    :return: list of (invocation id, state) in the order the triggers fired
+    """
+    fired = []
+
+    async def run_trigger(invocation_id, repository_id):
+        async for event in create_trigger(client, invocation_id, repository_id).run():
+            fired.append((event.payload.get("workflow_invocation_id"), event.payload.get("state")))
+
+    await asyncio.gather(*[run_trigger(invocation_id, repository_id)
+                           for invocation_id, repository_id in invocations.items()])
+    return fired
+
+
+def test_release_per_job_and_fail_fast():
+    client = FakeDataformClient({
+        "fast": ["RUNNING", "SUCCEEDED"],
+        "slow": ["RUNNING", "RUNNING", "RUNNING", "SUCCEEDED"],
+        "failed": ["RUNNING", "FAILED"],
+        "cancelled": ["RUNNING", "RUNNING", "CANCELLED"]
+    })
+    fired = asyncio.run(run_level(client, {"fast": "repository", "slow": "repository",
+                                           "failed": "repository", "cancelled": "repository"}))
+    assert sorted(fired[:2]) == [("failed", "FAILED"), ("fast", "SUCCEEDED")]
+    assert fired[2:] == [("cancelled", "CANCELLED"), ("slow", "SUCCEEDED")]
+    # one list call per poll, with only the invocations still pending
+    assert [call[3] for call in client.calls] == [["cancelled", "failed", "fast", "slow"],
+                                                  ["cancelled", "failed", "fast", "slow"],
+                                                  ["cancelled", "slow"], ["slow"]]
+    assert DataformInvocationBatch.batches == {}
+
+
+def test_api_calls_follow_polls_not_jobs():
+    jobs = {f"job_{index}": ["RUNNING", "RUNNING", "SUCCEEDED"] for index in range(15)}
+    client = FakeDataformClient(jobs)
+    asyncio.run(run_level(client, {invocation_id: "repository" for invocation_id in jobs}))
+    assert len(client.calls) == 3
+
+
+def test_one_list_call_per_repository():
+    client = FakeDataformClient({"first": ["RUNNING", "SUCCEEDED"], "second": ["RUNNING", "SUCCEEDED"]})
+    asyncio.run(run_level(client, {"first": "repository_a", "second": "repository_b"}))
+    assert sorted(call[2] for call in client.calls) == ["repository_a", "repository_a",
+                                                        "repository_b", "repository_b"]
+
+
+def test_cancelled_trigger_stops_the_loop():
+    client = FakeDataformClient({"never_ends": ["RUNNING"]})
+
+    async def cancel_waiting_trigger():
+        waiting = asyncio.ensure_future(create_trigger(client, "never_ends", batch_key="cancelled").run().__anext__())
+        await asyncio.sleep(POLL_INTERVAL * 5)
+        waiting.cancel()
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            pass
+        calls = len(client.calls)
+        await asyncio.sleep(POLL_INTERVAL * 5)
+        return calls
+
+    calls = asyncio.run(cancel_waiting_trigger())
+    assert calls > 0 and len(client.calls) == calls
+    assert DataformInvocationBatch.batches == {}
+
+
+def test_client_error_fires_error_event():
+    class FailingClient:
+        def list_invocation_states(self, project_id, region, repository_id, invocation_ids):
+            raise RuntimeError("quota exceeded")
+
+    fired = asyncio.run(run_level(FailingClient(), {"job": "repository"}))
+    assert fired == [("job", "ERROR")]
+    assert DataformInvocationBatch.batches == {}
+
+
+def test_polls_logged_as_timing_events():
+    client = FakeDataformClient({"job": ["RUNNING", "FAILED"]})
+    trigger = create_trigger(client, "job")
+    trigger.timing_fields = {"telemetry": "aef_timing", "job_id": "J1"}
+    handler = RecordingHandler()
+    timing_logger.addHandler(handler)
+    timing_logger.setLevel(logging.INFO)
+
+    async def run_trigger():
+        return [event.payload.get("state") async for event in trigger.run()]
+
+    try:
+        assert asyncio.run(run_trigger()) == ["FAILED"]
+    finally:
+        timing_logger.removeHandler(handler)
+    events = [json.loads(record.getMessage()) for record in handler.records]
+    assert [(event["event"], event["status"], event["job_id"]) for event in events] == [
+        ("job_poll", "running", "J1"), ("job_poll", "failed", "J1")]
+
+
+def test_api_client_lists_only_pending_invocations():
+    history = [(f"old_{index}", "SUCCEEDED") for index in range(1000)] + [("a", "RUNNING"), ("b", "FAILED")]
+    api = FakeDataformApi(history)
+    assert list_states(api, ["a", "b"]) == {"a": "RUNNING", "b": "FAILED"}
+    assert (len(api.requests), api.pages_read, api.gets) == (1, 1, [])
+    assert api.requests[0]["filter"] == ('name = "projects/project/locations/region/repositories/repository/'
+                                         'workflowInvocations/a" OR name = "projects/project/locations/region/'
+                                         'repositories/repository/workflowInvocations/b"')
+
+
+def test_api_client_reads_one_page_per_hundred_pending_invocations():
+    pending = [f"pending_{index}" for index in range(150)]
+    api = FakeDataformApi([(f"old_{index}", "SUCCEEDED") for index in range(1000)]
+                          + [(invocation_id, "RUNNING") for invocation_id in pending])
+    assert list_states(api, pending) == {invocation_id: "RUNNING" for invocation_id in pending}
+    assert (api.pages_read, api.gets) == (2, [])
+
+
+def test_api_client_bounds_pages_and_gets_what_the_list_missed():
+    # a server ignoring the filter lists the whole history, where the pending invocations come last
+    history = [(f"old_{index}", "SUCCEEDED") for index in range(1000)] + [("a", "RUNNING"), ("b", "SUCCEEDED")]
+    api = FakeDataformApi(history, apply_filter=False)
+    assert list_states(api, ["a", "b"]) == {"a": "RUNNING", "b": "SUCCEEDED"}
+    assert (api.pages_read, api.gets) == (1, ["a", "b"])
+
+
+def main():
+    """Main function running every test of this file"""
+    tests = [test for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print('ok ' + test.__name__)
+
+
+if __name__ == "__main__":
+    main()
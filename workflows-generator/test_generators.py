@@ -0,0 +1,298 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Offline checks of the structure of the generated Cloud Workflows and Composer DAGs: the step graph of the
+# parsed YAML, and the task groups, operators and dependencies the DAG declares when run against recording
+# stubs of Airflow and the Google providers. Runs without Airflow:
+#   python3 test_generators.py
+
+import contextlib
+import io
+import json
+import os
+import sys
+import types
+import yaml
+from benchmark import stub_provider_modules
+from ComposerDagGenerator import ComposerDagGenerator
+from WorkflowsGenerator import WorkflowsGenerator
+
+DEFINITIONS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../workflow-definitions")
+EXEC_CONFIG = {
+    "pRegion": "us-central1",
+    "pProjectID": "project",
+    "pFunctionIntermediateName": "orch-framework-intermediate",
+    "pJobsDefinitionsBucket": "jobs_bucket"
+}
+
+
+def read_definition(name):
+    """method to read a definition of the workflow-definitions folder"""
+    with open(os.path.join(DEFINITIONS_FOLDER, name + ".json"), encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+
+def generate(workflow_config, dag_name="dag"):
+    """
+    Function to run the generator of a definition in-process
+    :return: tuple of generated code and printed output
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        if workflow_config.get("engine") == "cloud_workflows":
+            generator = WorkflowsGenerator(workflow_config.get("definition"), EXEC_CONFIG, True, "")
+        else:
+            generator = ComposerDagGenerator(workflow_config.get("definition"), EXEC_CONFIG, True, "", dag_name)
+        generator.load_templates()
+        body = generator.generate_workflows_body()
+    return body, output.getvalue()
+
+
+def workflow_structure(yaml_text):
+    """
+    Function to get the step graph of a generated Cloud Workflow
+    :return: list of (step path, call, next steps) in definition order
+    """
+    structure = []
+
+    def walk(steps, path):
+        for step in steps:
+            for name, body in step.items():
+                step_path = path + [name]
+                nexts = [branch.get("next") for branch in body.get("switch", [])]
+                if "next" in body:
+                    nexts.append(body.get("next"))
+                structure.append(("/".join(step_path), body.get("call"), nexts))
+                for branch in body.get("parallel", {}).get("branches", []):
+                    walk([branch], step_path)
+                walk(body.get("steps", []), step_path)
+                walk(body.get("try", {}).get("steps", []), step_path)
+
+    walk(yaml.safe_load(yaml_text).get("main").get("steps"), [])
+    return structure
+
+
+class RecordedNode:
+    """Task or task group of a recorded DAG, recording the dependencies declared with >>"""
+
+    def __init__(self, recorder, node_id):
+        self.recorder = recorder
+        self.node_id = node_id
+
+    def __rshift__(self, other):
+        self.recorder.edges.append((self.node_id, other.node_id))
+        return other
+
+
+class DagRecorder:
+    """Stand-in for Airflow recording the task groups, operators and dependencies of a DAG"""
+
+    def __init__(self):
+        self.group_path = []
+        # full task id -> operator class name
+        self.tasks = {}
+        self.edges = []
+
+    def stub(self, name):
+        """method to resolve any name imported from Airflow or the Google providers"""
+        if name == "TaskGroup":
+            return self.task_group
+        if name == "DAG":
+            return lambda *args, **kwargs: contextlib.nullcontext()
+        if name == "Variable":
+            return types.SimpleNamespace(get=lambda *args, **kwargs: "stub")
+        if name[0].isupper():
+            return lambda *args, **kwargs: self.task(name, **kwargs)
+        return types.SimpleNamespace(DAG=self.stub("DAG"), EmptyOperator=self.stub("EmptyOperator"))
+
+    def task(self, operator, task_id, **kwargs):
+        """method to record an operator"""
+        node = RecordedNode(self, ".".join(self.group_path + [task_id]))
+        self.tasks[node.node_id] = operator
+        return node
+
+    @contextlib.contextmanager
+    def task_group(self, group_id, **kwargs):
+        """method to record a task group, the tasks created inside it being prefixed by its id"""
+        self.group_path.append(group_id)
+        try:
+            yield RecordedNode(self, ".".join(self.group_path))
+        finally:
+            self.group_path.pop()
+
+
+def record_dag(dag_code):
+    """
+    Function to run a generated DAG against recording stubs
+    :return: DagRecorder holding its tasks and dependencies
+    """
+    recorder = DagRecorder()
+    stubs = stub_provider_modules(dag_code)
+    for module_name, module in stubs.items():
+        if module_name != "google.cloud.storage":
+            module.__getattr__ = recorder.stub
+    saved_modules = {name: sys.modules[name] for name in stubs if name in sys.modules}
+    sys.modules.update(stubs)
+    try:
+        exec(compile(dag_code, "<generated_dag>", "exec"), {"__name__": "generated_dag"})
+    finally:
+        for name in stubs:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved_modules)
+    return recorder
+
+
+def crafted_definition(engine):
+    """
+    Function to build a definition with a NEXT jump in a single thread level followed by a parallel level
+    :return: definition file content
+    """
+    executors = {"J01": "dataform-tag-executor", "J02": "dataform-tag-executor",
+                 "J03": "dataproc-serverless-job-executor", "J04": "dataflow-flextemplate-job-executor",
+                 "J05": "dataform-tag-executor"}
+    names = {"J01": "first_job", "J02": "skipped_job", "J03": "third_job", "J04": "parallel_a", "J05": "parallel_b"}
+
+    def step(job_id):
+        return {"JOB_ID": job_id, "JOB_NAME": names[job_id], "TYPE": "async", "COMPOSER_STEP": executors[job_id],
+                "FUNCTION_ID_NAME": executors[job_id], "FUNCTION_STATUS_NAME": executors[job_id],
+                "WAIT_TIME_SECONDS": "30", "ASYNC_TIMEOUT_LOOP_IN_MINUTES": "12"}
+
+    return {"engine": engine, "definition": [
+        {"LEVEL_ID": "1", "THREADS": [
+            {"THREAD_ID": "1", "STEPS": [dict(step("J01"), NEXT="J03"), step("J02"), step("J03")]}]},
+        {"LEVEL_ID": "2", "THREADS": [
+            {"THREAD_ID": "2", "STEPS": [step("J04")]},
+            {"THREAD_ID": "3", "STEPS": [step("J05")]}]}
+    ]}
+
+
+def expected_job_steps(path, job_name, next_step):
+    """method to get the expected steps of an async job: launch, then wait and status until it succeeds"""
+    group = f"{path}/{job_name}_Group"
+    return [
+        (group, None, []),
+        (f"{group}/{job_name}", "http.post", [f"{job_name}_Wait"]),
+        (f"{group}/{job_name}_Wait", "sys.sleep", [f"{job_name}_Status"]),
+        (f"{group}/{job_name}_Status", "http.post", [f"{job_name}_EvaluateStatus"]),
+        (f"{group}/{job_name}_EvaluateStatus", None, [next_step, f"{job_name}_Wait"])
+    ]
+
+
+def expected_job_tasks(group, job_name, executor):
+    """
+    Function to get the expected tasks of a job of a Composer DAG
+    :return: tuple of tasks, as full task id to operator, and dependencies inside the job
+    """
+    if executor == "dataproc-serverless-job-executor":
+        tasks = [("batch_id", "PythonOperator"),
+                 (f"create_batch_for_{job_name}", "DataprocCreateBatchOperator"),
+                 (f"wait_for_batch_completion_for_{job_name}", "DataprocBatchSensor"),
+                 (f"get_batch_for_{job_name}", "DataprocGetBatchOperator")]
+    elif executor == "dataflow-flextemplate-job-executor":
+        tasks = [(f"dataflow_flex_template_{job_name}", "DataflowStartFlexTemplateOperator")]
+    else:
+        tasks = [(f"compilation_task_{job_name}", "DataformCreateCompilationResultOperator"),
+                 (f"workflow_inv_{job_name}", "DataformCreateWorkflowInvocationOperator"),
+                 (f"is_workflow_{job_name}_invocation_done", "DataformBatchInvocationSensor")]
+    task_ids = [f"{group}.{job_name}.{task_id}" for task_id, operator in tasks]
+    return ({task_id: operator for task_id, (name, operator) in zip(task_ids, tasks)},
+            list(zip(task_ids, task_ids[1:])))
+
+
+def expected_dag(jobs, group_edges):
+    """
+    Function to get the expected structure of a Composer DAG
+    :param jobs: list of (thread task group id, job name, executor)
+    :param group_edges: dependencies between task groups, besides start >> Level_1 >> ... >> end
+    :return: tuple of tasks and dependencies, in declaration order
+    """
+    tasks = {}
+    edges = []
+    for group, job_name, executor in jobs:
+        job_tasks, job_edges = expected_job_tasks(group, job_name, executor)
+        tasks.update(job_tasks)
+        edges += job_edges
+    levels = sorted({group.split(".")[0] for group, job_name, executor in jobs})
+    tasks.update({"start": "EmptyOperator", "end": "EmptyOperator"})
+    chain = ["start"] + levels + ["end"]
+    return tasks, edges + group_edges + list(zip(chain, chain[1:]))
+
+
+def test_demo_cloud_workflow():
+    body, output = generate(read_definition("demo_pipeline_cloud_workflows"))
+    assert workflow_structure(body) == [
+        ("workflow", None, []),
+        ("workflow/Level_1", None, []),
+        ("workflow/Level_1/Level_1_Thread_1", None, []),
+        *expected_job_steps("workflow/Level_1/Level_1_Thread_1", "sample_serverless_spark_mainframe_ingestion",
+                            "continue"),
+        ("workflow/Level_1/Level_1_Thread_2", None, []),
+        *expected_job_steps("workflow/Level_1/Level_1_Thread_2", "sample_jdbc_dataflow_ingestion", "continue"),
+        ("workflow/Level_2_Thread_3", None, []),
+        *expected_job_steps("workflow/Level_2_Thread_3", "run_dataform_tag", "end")
+    ]
+
+
+def test_demo_composer_dag():
+    body, output = generate(read_definition("demo_pipeline_composer"), "demo_pipeline_composer")
+    recorder = record_dag(body)
+    tasks, edges = expected_dag([
+        ("Level_1.Level_1_Thread_1", "sample_serverless_spark_mainframe_ingestion", "dataproc-serverless-job-executor"),
+        ("Level_1.Level_1_Thread_2", "sample_jdbc_dataflow_ingestion", "dataflow-flextemplate-job-executor"),
+        ("Level_2.Level_2_Thread_3", "run_dataform_tag", "dataform-tag-executor")
+    ], [])
+    assert (recorder.tasks, recorder.edges) == (tasks, edges)
+
+
+def test_next_jump_and_single_thread_level_cloud_workflow():
+    body, output = generate(crafted_definition("cloud_workflows"))
+    assert output == "!Warning, jobs not reached through NEXT by any thread are not generated: J02\n"
+    # a single thread level is not wrapped in a parallel step and goes on to the next level when it ends
+    assert workflow_structure(body) == [
+        ("workflow", None, []),
+        ("workflow/Level_1_Thread_1", None, []),
+        *expected_job_steps("workflow/Level_1_Thread_1", "first_job", "third_job"),
+        *expected_job_steps("workflow/Level_1_Thread_1", "third_job", "Level_2"),
+        ("workflow/Level_2", None, []),
+        ("workflow/Level_2/Level_2_Thread_2", None, []),
+        *expected_job_steps("workflow/Level_2/Level_2_Thread_2", "parallel_a", "continue"),
+        ("workflow/Level_2/Level_2_Thread_3", None, []),
+        *expected_job_steps("workflow/Level_2/Level_2_Thread_3", "parallel_b", "continue")
+    ]
+
+
+def test_next_jump_and_single_thread_level_composer_dag():
+    body, output = generate(crafted_definition("composer"))
+    assert output == "!Warning, jobs not reached through NEXT by any thread are not generated: J02\n"
+    recorder = record_dag(body)
+    tasks, edges = expected_dag([
+        ("Level_1.Level_1_Thread_1", "first_job", "dataform-tag-executor"),
+        ("Level_1.Level_1_Thread_1", "third_job", "dataproc-serverless-job-executor"),
+        ("Level_2.Level_2_Thread_2", "parallel_a", "dataflow-flextemplate-job-executor"),
+        ("Level_2.Level_2_Thread_3", "parallel_b", "dataform-tag-executor")
+    ], [("Level_1.Level_1_Thread_1.first_job", "Level_1.Level_1_Thread_1.third_job")])
+    assert sorted(recorder.tasks.items()) == sorted(tasks.items())
+    assert sorted(recorder.edges) == sorted(edges)
+
+
+def main():
+    """Main function running every test of this file"""
+    tests = [test for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print('ok ' + test.__name__)
+
+
+if __name__ == "__main__":
+    main()
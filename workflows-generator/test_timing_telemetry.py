@@ -0,0 +1,103 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Offline checks of the Composer timing telemetry: the generated launch events and their analysis by
+# timing_analyzer.py. Runs without Airflow:
+#   python3 test_timing_telemetry.py
+
+import ast
+import json
+import os
+from ComposerDagGenerator import ComposerDagGenerator
+from timing_analyzer import analyze
+
+DEFINITION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "../workflow-definitions/demo_pipeline_composer.json")
+EXEC_CONFIG = {
+    "pRegion": "us-central1",
+    "pProjectID": "project",
+    "pFunctionIntermediateName": "orch-framework-intermediate",
+    "pJobsDefinitionsBucket": "jobs_bucket",
+    "pTimingTelemetry": "True"
+}
+
+
+def generate_dag():
+    """method to generate the demo Composer DAG with timing telemetry"""
+    with open(DEFINITION_FILE, encoding="utf-8") as json_file:
+        definition = json.load(json_file).get("definition")
+    generator = ComposerDagGenerator(definition, EXEC_CONFIG, True, "", "demo_pipeline_composer")
+    generator.load_templates()
+    return generator.generate_workflows_body()
+
+
+def composer_event(event, job_id, job_name, task_id, timestamp, status=None):
+    """method to build a timing event as logged by the Composer callbacks and sensors"""
+    return {"telemetry": "aef_timing", "event": event, "workflow_name": "demo_pipeline_composer", "run_id": "run_1",
+            "job_id": job_id, "job_name": job_name, "level_id": "1", "thread_id": "1", "task_id": task_id,
+            "status": status, "timestamp": timestamp}
+
+
+def test_launch_tasks_end_once_the_job_is_launched():
+    tree = ast.parse(generate_dag())
+    launch_task_ids = [ast.literal_eval(node.value) for node in ast.walk(tree) if isinstance(node, ast.Assign)
+                       and getattr(node.targets[0], "id", None) == "timing_launch_task_ids"][0]
+    assert launch_task_ids
+    for task_id in launch_task_ids:
+        calls = [node for node in ast.walk(tree) if isinstance(node, ast.Call)
+                 and any(keyword.arg == "task_id" and getattr(keyword.value, "value", None) == task_id
+                         for keyword in node.keywords)]
+        assert len(calls) == 1, task_id
+        # a task waiting for the job to finish would report its whole runtime as launch latency
+        arguments = {keyword.arg: getattr(keyword.value, "value", None) for keyword in calls[0].keywords}
+        assert arguments.get("asynchronous") is True, task_id
+
+
+def test_composer_events_analysis():
+    events = [
+        # Dataform: the invocation task ends at launch, then the batched sensor logs its polls
+        composer_event("task_start", "J1", "dataform_job", "workflow_inv_dataform_job", 0),
+        composer_event("task_end", "J1", "dataform_job", "workflow_inv_dataform_job", 2, "success"),
+        composer_event("job_launched", "J1", "dataform_job", "workflow_inv_dataform_job", 2),
+        composer_event("task_start", "J1", "dataform_job", "wait_for_dataform_job", 3),
+        composer_event("job_poll", "J1", "dataform_job", "wait_for_dataform_job", 63, "running"),
+        composer_event("job_poll", "J1", "dataform_job", "wait_for_dataform_job", 123, "running"),
+        composer_event("job_poll", "J1", "dataform_job", "wait_for_dataform_job", 183, "success"),
+        composer_event("task_end", "J1", "dataform_job", "wait_for_dataform_job", 184, "success"),
+        # Dataproc: the deferrable batch creation only ends with the batch, so there is no launch or poll
+        composer_event("task_start", "J2", "dataproc_job", "batch_id", 0),
+        composer_event("task_end", "J2", "dataproc_job", "batch_id", 1, "success"),
+        composer_event("task_start", "J2", "dataproc_job", "create_batch_for_dataproc_job", 1),
+        composer_event("task_end", "J2", "dataproc_job", "create_batch_for_dataproc_job", 600, "success"),
+        composer_event("task_start", "J2", "dataproc_job", "wait_for_batch_completion_for_dataproc_job", 601),
+        composer_event("task_end", "J2", "dataproc_job", "wait_for_batch_completion_for_dataproc_job", 602, "success")
+    ]
+    jobs = analyze(events).get("jobs")
+    dataform, dataproc = jobs.get("J1"), jobs.get("J2")
+    assert (dataform.get("p50_seconds"), dataform.get("launch_latency_p50_seconds")) == (184, 2)
+    assert (dataform.get("polls_per_run"), dataform.get("poll_overhead_estimate_seconds")) == (3, 30)
+    assert (dataproc.get("p50_seconds"), dataproc.get("launch_latency_p50_seconds")) == (602, None)
+    assert (dataproc.get("polls_per_run"), dataproc.get("poll_overhead_estimate_seconds")) == (0, None)
+
+
+def main():
+    """Main function running every test of this file"""
+    tests = [test for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print('ok ' + test.__name__)
+
+
+if __name__ == "__main__":
+    main()
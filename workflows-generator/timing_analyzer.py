@@ -0,0 +1,231 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from commons import *
+
+MIN_WAIT_SECONDS = 5
+MAX_WAIT_SECONDS = 300
+POLLS_PER_MEDIAN_RUN = 10
+
+
+def read_timing_events(logs_file):
+    """
+    Function to read timing events from exported logs
+    :param logs_file: JSONL file, either Cloud Logging entries or raw timing payloads
+    :return: list of timing events
+    """
+    events = []
+    with open(logs_file, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            payload = entry.get("jsonPayload", entry)
+            if "textPayload" in entry and "{" in entry.get("textPayload"):
+                text = entry.get("textPayload")
+                try:
+                    payload = json.loads(text[text.index("{"):])
+                except ValueError:
+                    continue
+            if payload.get("telemetry") == "aef_timing":
+                events.append(payload)
+    return events
+
+
+def trend_slope(values):
+    """method to compute the least squares slope of values over their run index"""
+    if len(values) < 2:
+        return 0.0
+    mean_x = (len(values) - 1) / 2.0
+    mean_y = sum(values) / len(values)
+    numerator = sum((index - mean_x) * (value - mean_y) for index, value in enumerate(values))
+    denominator = sum((index - mean_x) ** 2 for index in range(len(values)))
+    return numerator / denominator
+
+
+def build_job_runs(events):
+    """
+    Function to fold timing events into one record per run and job
+    :param events: timing events from both Cloud Workflows and Composer
+    :return: dictionary keyed by (run_id, job_id)
+    """
+    job_runs = {}
+    for event in sorted(events, key=lambda item: float(item.get("timestamp"))):
+        key = (event.get("run_id"), event.get("job_id"))
+        timestamp = float(event.get("timestamp"))
+        job_run = job_runs.setdefault(key, {
+            "run_id": event.get("run_id"),
+            "job_id": event.get("job_id"),
+            "job_name": event.get("job_name"),
+            "level_id": event.get("level_id"),
+            "thread_id": event.get("thread_id"),
+            "wait_seconds": event.get("wait_seconds"),
+            "start": None,
+            "launched": None,
+            "polls": [],
+            "end": None,
+            "status": None
+        })
+        name = event.get("event")
+        if name in ("job_start", "task_start") and job_run.get("start") is None:
+            job_run["start"] = timestamp
+        elif name == "job_launched":
+            job_run["launched"] = timestamp
+        elif name == "job_poll":
+            job_run["polls"].append(timestamp)
+            job_run["end"] = timestamp
+            job_run["status"] = event.get("status")
+        elif name in ("job_end", "task_end"):
+            job_run["end"] = timestamp
+            if job_run.get("status") != "failed":
+                job_run["status"] = event.get("status")
+    return {key: job_run for key, job_run in job_runs.items()
+            if job_run.get("start") is not None and job_run.get("end") is not None}
+
+
+def poll_overhead(job_run):
+    """
+    method to estimate the time slept after a job had already finished. Status checks only tell the job ended
+    somewhere between the last two of them, so this is half of that interval, an expected value and not a
+    measurement
+    """
+    checkpoints = ([job_run.get("launched")] if job_run.get("launched") else []) + job_run.get("polls")
+    if len(checkpoints) < 2:
+        return None
+    return (checkpoints[-1] - checkpoints[-2]) / 2.0
+
+
+def level_barrier_idle(job_runs):
+    """
+    Function to compute, per run and level, the time finished threads spend waiting for the slowest one
+    :return: dictionary keyed by (run_id, level_id) with idle seconds summed over threads
+    """
+    thread_ends = {}
+    for job_run in job_runs.values():
+        key = (job_run.get("run_id"), job_run.get("level_id"), job_run.get("thread_id"))
+        thread_ends[key] = max(thread_ends.get(key, job_run.get("end")), job_run.get("end"))
+    level_ends = {}
+    for (run_id, level_id, thread_id), end in thread_ends.items():
+        level_ends[(run_id, level_id)] = max(level_ends.get((run_id, level_id), end), end)
+    idle = {}
+    for (run_id, level_id, thread_id), end in thread_ends.items():
+        idle[(run_id, level_id)] = idle.get((run_id, level_id), 0.0) + level_ends[(run_id, level_id)] - end
+    return idle
+
+
+def analyze(events):
+    """
+    Function to aggregate timing events into a per job and per level report
+    :param events: timing events
+    :return: report dictionary with "jobs" and "levels"
+    """
+    job_runs = build_job_runs(events)
+    runs_by_job = {}
+    for job_run in sorted(job_runs.values(), key=lambda item: item.get("start")):
+        runs_by_job.setdefault(job_run.get("job_id"), []).append(job_run)
+
+    jobs = {}
+    for job_id, runs in runs_by_job.items():
+        durations = [run.get("end") - run.get("start") for run in runs]
+        launch_latencies = [run.get("launched") - run.get("start") for run in runs if run.get("launched")]
+        overheads = [overhead for overhead in map(poll_overhead, runs) if overhead is not None]
+        jobs[job_id] = {
+            "job_name": runs[-1].get("job_name"),
+            "level_id": runs[-1].get("level_id"),
+            "runs": len(runs),
+            "failed_runs": len([run for run in runs if run.get("status") == "failed"]),
+            "p50_seconds": percentile(durations, 50),
+            "p90_seconds": percentile(durations, 90),
+            "p99_seconds": percentile(durations, 99),
+            "launch_latency_p50_seconds": percentile(launch_latencies, 50),
+            "polls_per_run": sum(len(run.get("polls")) for run in runs) / len(runs),
+            "poll_overhead_estimate_seconds": sum(overheads) / len(overheads) if overheads else None,
+            "trend_seconds_per_run": trend_slope(durations)
+        }
+
+    levels = {}
+    for (run_id, level_id), idle in level_barrier_idle(job_runs).items():
+        level = levels.setdefault(level_id, {"runs": 0, "barrier_idle_seconds": []})
+        level["runs"] += 1
+        level["barrier_idle_seconds"].append(idle)
+    for level in levels.values():
+        idle_values = level.pop("barrier_idle_seconds")
+        level["barrier_idle_p50_seconds"] = percentile(idle_values, 50)
+        level["barrier_idle_max_seconds"] = max(idle_values)
+    return {"jobs": jobs, "levels": levels}
+
+
+def build_duration_hints(report):
+    """
+    Function to derive the duration hints consumed by the generators (pDurationHintsFile)
+    :param report: report returned by analyze
+    :return: dictionary of hints keyed by JOB_ID
+    """
+    hints = {}
+    for job_id, job in report.get("jobs").items():
+        wait_seconds = int(round(job.get("p50_seconds") / POLLS_PER_MEDIAN_RUN))
+        hints[job_id] = {
+            "job_name": job.get("job_name"),
+            "runs": job.get("runs"),
+            "p50_seconds": round(job.get("p50_seconds"), 3),
+            "p90_seconds": round(job.get("p90_seconds"), 3),
+            "recommended_wait_seconds": max(MIN_WAIT_SECONDS, min(MAX_WAIT_SECONDS, wait_seconds))
+        }
+    return hints
+
+
+def format_seconds(value):
+    """method to format optional seconds values"""
+    return '-' if value is None else f'{value:.1f}'
+
+
+def print_report(report):
+    """method to print the analyzer report, OVERHEAD~ being the estimated poll overhead"""
+    print(f'{"JOB_ID":<12}{"LEVEL":>6}{"RUNS":>6}{"P50":>10}{"P90":>10}{"P99":>10}'
+          f'{"LAUNCH":>10}{"POLLS":>8}{"OVERHEAD~":>10}{"TREND/RUN":>11}')
+    for job_id, job in sorted(report.get("jobs").items()):
+        print(f'{job_id:<12}{job.get("level_id"):>6}{job.get("runs"):>6}'
+              f'{format_seconds(job.get("p50_seconds")):>10}{format_seconds(job.get("p90_seconds")):>10}'
+              f'{format_seconds(job.get("p99_seconds")):>10}'
+              f'{format_seconds(job.get("launch_latency_p50_seconds")):>10}{job.get("polls_per_run"):>8.1f}'
+              f'{format_seconds(job.get("poll_overhead_estimate_seconds")):>10}'
+              f'{job.get("trend_seconds_per_run"):>+11.1f}')
+    print()
+    print(f'{"LEVEL":<12}{"RUNS":>6}{"IDLE P50":>10}{"IDLE MAX":>10}')
+    for level_id, level in sorted(report.get("levels").items(), key=lambda item: int(item[0])):
+        print(f'{level_id:<12}{level.get("runs"):>6}{format_seconds(level.get("barrier_idle_p50_seconds")):>10}'
+              f'{format_seconds(level.get("barrier_idle_max_seconds")):>10}')
+
+
+def main():
+    """
+    Main function for the timing analyzer
+
+    :param logs_file: exported logs (JSONL) containing timing events of generated workflows or DAGs
+    :param hints_file: optional duration hints file to write, usable as pDurationHintsFile
+    :return: NA
+    """
+    if len(sys.argv) < 2:
+        print('...Usage: ' + sys.argv[0] + ' <exported-logs>.jsonl [<duration-hints-file>.json]')
+        sys.exit(0)
+    report = analyze(read_timing_events(sys.argv[1]))
+    print_report(report)
+    if len(sys.argv) > 2:
+        write_result(sys.argv[2], json.dumps(build_duration_hints(report), indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import ctypes.util
+import json
+import select
+import struct
+import time
+from commons import *
+from ComposerDagGenerator import ComposerDagGenerator
+from WorkflowsGenerator import WorkflowsGenerator
+
+WATCHED_EXTENSIONS = (".json", ".jsonl", ".py")
+# parameters naming files the generators read, a change to them regenerates every definition
+DATA_FILE_PARAMETERS = ["pDurationHintsFile", "pRunHistoryFile"]
+POLLING_INTERVAL_SECONDS = 0.05
+# events arriving within this window after the first one are handled together (editor save bursts)
+DEBOUNCE_SECONDS = 0.02
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """File watcher based on Linux inotify, called through libc so no extra package is needed"""
+
+    def __init__(self, folders):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        self.folders = {}
+        mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+        for folder in folders:
+            watch_descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), mask)
+            if watch_descriptor < 0:
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed for " + folder)
+            self.folders[watch_descriptor] = folder
+
+    def read_events(self, timeout):
+        """method to read pending events, waiting at most timeout seconds"""
+        changed = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed
+        buffer = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(buffer):
+            watch_descriptor, mask, cookie, length = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b"\0").decode("utf-8")
+            offset += length
+            if watch_descriptor in self.folders:
+                changed.add(os.path.join(self.folders[watch_descriptor], name))
+        return changed
+
+    def wait_for_changes(self):
+        """method to block until files change, returns the changed paths"""
+        changed = self.read_events(None)
+        while True:
+            more = self.read_events(DEBOUNCE_SECONDS)
+            if not more:
+                return changed
+            changed |= more
+
+    def close(self):
+        """method to release the inotify file descriptor"""
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """File watcher comparing modification times, used where inotify is not available"""
+
+    def __init__(self, folders):
+        self.folders = folders
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        """method to get the modification time of every file in the watched folders"""
+        snapshot = {}
+        for folder in self.folders:
+            for entry in os.scandir(folder):
+                if entry.is_file():
+                    snapshot[entry.path] = entry.stat().st_mtime_ns
+        return snapshot
+
+    def wait_for_changes(self):
+        """method to block until files change, returns the changed paths"""
+        while True:
+            time.sleep(POLLING_INTERVAL_SECONDS)
+            snapshot = self.take_snapshot()
+            changed = {path for path in snapshot.keys() | self.snapshot.keys()
+                       if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+            if changed:
+                return changed
+
+    def close(self):
+        """method to stop watching, nothing to release when polling"""
+
+
+def create_file_watcher(folders):
+    """method to get an inotify watcher, falling back to polling"""
+    try:
+        return InotifyWatcher(folders)
+    except (OSError, AttributeError, TypeError) as err:
+        print('inotify not available, polling for changes: ' + str(err))
+        return PollingWatcher(folders)
+
+
+class OrchestrationWatcher:
+    """
+    Long-lived generator: keeps templates and parsed definitions in memory and, on every change,
+    regenerates only the outputs depending on the changed file
+    """
+
+    def __init__(self, definitions_folder, parameters_file, workflows_output_folder, composer_output_folder):
+        self.definitions_folder = os.path.abspath(definitions_folder)
+        self.parameters_file = os.path.abspath(parameters_file)
+        self.workflows_output_folder = workflows_output_folder
+        self.composer_output_folder = composer_output_folder
+        self.exec_config = {}
+        self.definitions = {}
+        self.templates = {}
+        self.template_users = {}
+        self.outputs = {}
+        self.current_templates = None
+        for generator_class in (WorkflowsGenerator, ComposerDagGenerator):
+            sys.modules[generator_class.__module__].read_template = self.read_template
+
+    def template_path(self, template, generate_for_pipeline, templates_folder, file_extension):
+        """method to resolve a template path the same way commons.read_template does"""
+        base_folder = os.path.dirname(os.path.abspath(__file__)) if generate_for_pipeline else os.getcwd()
+        return os.path.join(base_folder, templates_folder, template + "." + file_extension)
+
+    def read_template(self, template, generate_for_pipeline, templates_folder, file_extension):
+        """cached read_template, also recording the templates used by the definition being generated"""
+        path = self.template_path(template, generate_for_pipeline, templates_folder, file_extension)
+        if path not in self.templates:
+            self.templates[path] = read_template(template, generate_for_pipeline, templates_folder, file_extension)
+        if self.current_templates is not None:
+            self.current_templates.add(path)
+        return self.templates[path]
+
+    def template_folders(self):
+        """method to get the folders holding the templates of both engines"""
+        base_folder = os.path.dirname(os.path.abspath(__file__))
+        folders = [os.path.join(base_folder, "workflows-templates"), os.path.join(base_folder, "composer-templates")]
+        return [folder for folder in folders if os.path.isdir(folder)]
+
+    def data_files(self):
+        """method to get the absolute paths of the hints and run history files set in the parameters"""
+        return {os.path.abspath(self.exec_config.get(parameter)) for parameter in DATA_FILE_PARAMETERS
+                if self.exec_config.get(parameter)}
+
+    def watched_folders(self):
+        """method to get the folders of the definitions, parameters, data files and templates"""
+        folders = [self.definitions_folder, os.path.dirname(self.parameters_file)] + self.template_folders()
+        folders += [os.path.dirname(path) for path in self.data_files() if os.path.isdir(os.path.dirname(path))]
+        return sorted(set(folders))
+
+    def load_parameters(self):
+        """method to load the parameters file"""
+        with open(self.parameters_file, encoding="utf-8") as json_file:
+            self.exec_config = process_config_key_values(json.load(json_file))
+
+    def load_definition(self, path):
+        """method to parse a definition file, returns False for json files that are not definitions"""
+        with open(path, encoding="utf-8") as json_file:
+            workflow_config = json.load(json_file)
+        if not isinstance(workflow_config, dict) or "engine" not in workflow_config:
+            return False
+        self.definitions[path] = workflow_config
+        return True
+
+    def generate(self, path):
+        """
+        method to regenerate the output of one definition. The templates it uses are recorded only once it
+        succeeds, so a failed generation keeps it reacting to the templates of its last successful one
+        """
+        workflow_config = self.definitions.get(path)
+        json_file_name = os.path.basename(path).split(".")[0]
+        if workflow_config.get("engine") == 'cloud_workflows':
+            generator = WorkflowsGenerator(workflow_config.get("definition"), self.exec_config, True,
+                                           self.parameters_file)
+            output_file = os.path.join(self.workflows_output_folder, json_file_name + ".yaml")
+        else:
+            generator = ComposerDagGenerator(workflow_config.get("definition"), self.exec_config, True,
+                                             self.parameters_file, json_file_name)
+            output_file = os.path.join(self.composer_output_folder, json_file_name + ".py")
+        self.current_templates = set()
+        try:
+            generator.load_templates()
+            write_result(output_file, generator.generate_workflows_body())
+            write_support_files(output_file, generator.support_files)
+            used_templates = self.current_templates
+        finally:
+            self.current_templates = None
+        for users in self.template_users.values():
+            users.discard(path)
+        for template in used_templates:
+            self.template_users.setdefault(template, set()).add(path)
+        self.outputs[path] = output_file
+        return output_file
+
+    def remove_output(self, path):
+        """method to delete the output of a definition that was deleted or is no longer a definition"""
+        output_file = self.outputs.pop(path, None)
+        for users in self.template_users.values():
+            users.discard(path)
+        if output_file and os.path.exists(output_file):
+            os.remove(output_file)
+            print(f'Removed {output_file}')
+
+    def generate_all(self):
+        """method to load every definition and generate all outputs"""
+        for entry in sorted(os.scandir(self.definitions_folder), key=lambda item: item.name):
+            if entry.name.endswith(".json") and os.path.abspath(entry.path) != self.parameters_file:
+                self.safe_call(self.load_definition, os.path.abspath(entry.path))
+        for path in list(self.definitions):
+            self.safe_call(self.generate, path)
+
+    def affected_definitions(self, changed_paths):
+        """
+        method to get the definitions to regenerate for a set of changed files
+        :param changed_paths: absolute paths of changed files
+        :return: set of definition paths
+        """
+        affected = set()
+        for path in changed_paths:
+            if path == self.parameters_file:
+                self.safe_call(self.load_parameters)
+                affected |= set(self.definitions)
+            elif path in self.data_files():
+                affected |= set(self.definitions)
+            elif path in self.templates or os.path.dirname(path) in self.template_folders():
+                self.templates.pop(path, None)
+                affected |= self.template_users.get(path, set())
+            elif os.path.dirname(path) == self.definitions_folder and path.endswith(".json"):
+                self.definitions.pop(path, None)
+                if os.path.exists(path) and self.safe_call(self.load_definition, path):
+                    affected.add(path)
+                elif path not in self.definitions:
+                    self.remove_output(path)
+        return {path for path in affected if path in self.definitions}
+
+    def safe_call(self, function, *args):
+        """method to report errors without stopping the watcher, e.g. a definition saved half edited"""
+        try:
+            return function(*args)
+        except Exception as err:
+            print('Error processing ' + ' '.join(str(arg) for arg in args) + ': ' + str(type(err)) + ' ' + str(err))
+            return None
+
+    def run(self):
+        """method to generate everything once and then regenerate on every change"""
+        self.load_parameters()
+        self.generate_all()
+        folders = self.watched_folders()
+        watcher = create_file_watcher(folders)
+        print(f'Watching {", ".join(folders)} ({type(watcher).__name__})')
+        while True:
+            changed_paths = {os.path.abspath(path) for path in watcher.wait_for_changes()
+                             if path.endswith(WATCHED_EXTENSIONS)}
+            start = time.perf_counter()
+            for path in sorted(self.affected_definitions(changed_paths)):
+                output_file = self.safe_call(self.generate, path)
+                if output_file:
+                    print(f'Regenerated {output_file} in {(time.perf_counter() - start) * 1000:.1f} ms')
+            if self.watched_folders() != folders:
+                # the parameters now point at hints or run history files in other folders
+                folders = self.watched_folders()
+                watcher.close()
+                watcher = create_file_watcher(folders)
+                print(f'Watching {", ".join(folders)} ({type(watcher).__name__})')
+
+
+def main():
+    """
+    Main function for watch mode
+
+    :param definitions_folder: folder with the Json definition files
+    :param parameters_file: Json parameters file
+    :param workflows_output_folder: folder for the generated Cloud Workflows files
+    :param composer_output_folder: folder for the generated Composer DAGs
+    :return: NA
+    """
+    if len(sys.argv) < 5:
+        print('...Usage: ' + sys.argv[0] + ' <definitions-folder> <parameters-file>.json '
+                                           '<cloud-workflows-output-folder> <composer-dags-output-folder>')
+        sys.exit(0)
+    watcher = OrchestrationWatcher(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()